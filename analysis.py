@@ -0,0 +1,183 @@
+"""
+analysis.py - analytical schedulability tests for fixed-priority task sets with shared resources
+"""
+
+import math
+import numpy as np
+
+from taskSet import TaskSet
+from semaphore import SemaphoreAP
+
+
+class Verdict:
+    SCHEDULABLE = 0  # A sufficient test passed, simulation will not miss a deadline
+    UNSCHEDULABLE = 1  # The processor is overloaded long enough that some deadline must be missed
+    UNKNOWN = 2  # Only a simulation can tell
+
+
+class AnalysisResult(object):
+    """Per task set arrays (first axis) of the tests, per task columns follow taskIds[set]"""
+
+    def __init__(self, task_ids, utilization, blocking, response_times, liu_layland, hyperbolic,
+                 response_time_test, overloaded):
+        self.taskIds: list[list[int]] = task_ids
+        self.utilization = utilization
+        self.blocking = blocking
+        self.responseTimes = response_times
+        self.liuLayland = liu_layland
+        self.hyperbolic = hyperbolic
+        self.responseTimeTest = response_time_test
+        self.overloaded = overloaded
+        self.verdicts = np.full(len(task_ids), Verdict.UNKNOWN)
+        self.verdicts[overloaded] = Verdict.UNSCHEDULABLE
+        self.verdicts[liu_layland | hyperbolic | response_time_test] = Verdict.SCHEDULABLE
+
+
+def longest_sections(task) -> dict[int, float]:
+    """the longest critical section of a task on each resource"""
+    sections: dict[int, float] = {}
+    for resource, length in task.sectionTable:
+        if resource != 0 and length > sections.get(resource, 0):
+            sections[resource] = length
+    return sections
+
+
+def blocking_terms(task_set: TaskSet, access_protocol: SemaphoreAP) -> tuple[dict[int, float], dict[int, set[int]]]:
+    """worst-case blocking of each task by lower priority tasks, and the tasks that can interfere with it
+
+    Sections are never nested, so a lower priority job can block at most once per critical section
+    under SIMPLE and PIP, and at most once per job under HLP. Under SIMPLE the blocking job keeps
+    its own priority, so every task above the lowest one that can block also interferes.
+    """
+    ceilings = task_set.get_highest_priorities()
+    tasks = [task for task in task_set]
+    sections = {task.id: longest_sections(task) for task in tasks}
+    blocking: dict[int, float] = {}
+    interferers: dict[int, set[int]] = {}
+
+    for task in tasks:
+        priority = task.get_priority()
+        lower = [other for other in tasks if other.get_priority() > priority]
+        interferers[task.id] = {other.id for other in tasks if other is not task and other.get_priority() <= priority}
+
+        if access_protocol == SemaphoreAP.HLP:
+            blocking[task.id] = max([length for other in lower for resource, length in sections[other.id].items()
+                                     if ceilings[resource] <= priority], default=0)
+        elif access_protocol == SemaphoreAP.PIP:
+            per_job = sum(max([length for resource, length in sections[other.id].items()
+                               if ceilings[resource] <= priority], default=0) for other in lower)
+            per_resource = sum(max([sections[other.id].get(resource, 0) for other in lower], default=0)
+                               for resource in ceilings if ceilings[resource] <= priority)
+            blocking[task.id] = min(per_job, per_resource)
+        else:
+            blockers = []
+            blocking[task.id] = 0
+            for resource, _ in task.sectionTable:
+                if resource == 0:
+                    continue
+                users = [other for other in lower if resource in sections[other.id]]
+                blockers.extend(users)
+                blocking[task.id] += max([sections[other.id][resource] for other in users], default=0)
+            if len(blockers) > 0:
+                lowest_blocker = max(other.get_priority() for other in blockers)
+                interferers[task.id] |= {other.id for other in lower if other.get_priority() < lowest_blocker}
+
+    return blocking, interferers
+
+
+def analyze(task_sets: list[TaskSet], access_protocol: SemaphoreAP = SemaphoreAP.PIP,
+            max_iterations: int = 1000) -> AnalysisResult:
+    """run the utilization bounds and response-time analysis on many task sets at once
+
+    Task sets are padded into (sets, tasks) arrays so the fixed-point iteration of all of them
+    runs as a handful of NumPy operations per step. The utilization bounds (with blocking, Sha et
+    al.) need implicit deadlines; response-time analysis needs constrained deadlines. Both are
+    skipped for SIMPLE's bounds and for task sets with aperiodic tasks.
+    """
+    set_count = len(task_sets)
+    size = max([len(task_set) for task_set in task_sets], default=0)
+    wcet = np.zeros((set_count, size))
+    period = np.ones((set_count, size))
+    deadline = np.full((set_count, size), np.inf)
+    priority = np.full((set_count, size), np.inf)
+    blocking = np.zeros((set_count, size))
+    interference = np.zeros((set_count, size, size))
+    valid = np.zeros((set_count, size), dtype=bool)
+    periodic = np.ones(set_count, dtype=bool)
+    task_ids: list[list[int]] = []
+
+    for s, task_set in enumerate(task_sets):
+        tasks = [task for task in task_set]
+        task_ids.append([task.id for task in tasks])
+        set_blocking, set_interferers = blocking_terms(task_set, access_protocol)
+        columns = {task.id: i for i, task in enumerate(tasks)}
+        for i, task in enumerate(tasks):
+            if task.period <= 0:
+                periodic[s] = False
+                continue
+            wcet[s, i] = task.wcet
+            period[s, i] = task.period
+            deadline[s, i] = task.relativeDeadline
+            priority[s, i] = task.get_priority()
+            blocking[s, i] = set_blocking[task.id]
+            valid[s, i] = True
+            for other_id in set_interferers[task.id]:
+                interference[s, i, columns[other_id]] = 1
+
+    utilization = np.where(valid, wcet / period, 0)
+    total_utilization = utilization.sum(axis=1)
+
+    # Response-time analysis: R = C + B + sum over interferers of ceil(R / T_j) * C_j
+    response_times = wcet + blocking
+    for _ in range(max_iterations):
+        demand = np.ceil(response_times[:, :, None] / period[:, None, :]) * wcet[:, None, :] * interference
+        updated = np.where(response_times > deadline, response_times, wcet + blocking + demand.sum(axis=2))
+        if np.array_equal(updated, response_times):
+            break
+        response_times = updated
+    constrained = np.all(~valid | (deadline <= period), axis=1)
+    response_time_test = periodic & constrained & np.all(~valid | (response_times <= deadline), axis=1)
+
+    # Utilization bounds with blocking, tasks taken in priority order
+    order = np.argsort(priority, axis=1, kind='stable')
+    sorted_utilization = np.take_along_axis(utilization, order, axis=1)
+    sorted_blocking = np.take_along_axis(np.where(valid, blocking / period, 0), order, axis=1)
+    sorted_valid = np.take_along_axis(valid, order, axis=1)
+    rank = np.arange(1, size + 1)
+    ll_bound = rank * (2 ** (1 / rank) - 1)
+    liu_layland = np.all(~sorted_valid | (np.cumsum(sorted_utilization, axis=1) + sorted_blocking <= ll_bound),
+                         axis=1)
+    preceding = np.cumprod(sorted_utilization + 1, axis=1) / (sorted_utilization + 1)
+    hyperbolic = np.all(~sorted_valid | (preceding * (sorted_utilization + sorted_blocking + 1) <= 2), axis=1)
+    implicit = np.all(~valid | (deadline == period), axis=1) & periodic
+    bounds_apply = implicit & (access_protocol != SemaphoreAP.SIMPLE)
+    liu_layland &= bounds_apply
+    hyperbolic &= bounds_apply
+
+    overloaded = np.zeros(set_count, dtype=bool)
+    for s, task_set in enumerate(task_sets):
+        overloaded[s] = periodic[s] and total_utilization[s] > 1 and is_overloaded(task_set, total_utilization[s])
+
+    return AnalysisResult(task_ids, total_utilization, blocking, response_times, liu_layland, hyperbolic,
+                          response_time_test, overloaded)
+
+
+def is_overloaded(task_set: TaskSet, utilization: float) -> bool:
+    """whether the schedule window is long enough for utilization > 1 to force a deadline miss
+
+    After the largest offset, k hyperperiods release k * H * U of work whose deadlines fall within
+    k * H + max(D). If none were missed, it would all fit in that time, which fails once
+    k * H * (U - 1) > max(D) for a k whose deadlines still come before the end of the window.
+    """
+    hyperperiod = task_set.get_hyperperiod()
+    if hyperperiod is None:
+        return False
+    start = max([task_set.startTime] + [task.offset for task in task_set])
+    max_deadline = max(task.relativeDeadline for task in task_set)
+    repeats = math.ceil((task_set.endTime - start - max_deadline) / hyperperiod) - 1
+    return repeats >= 1 and repeats * hyperperiod * (utilization - 1) > max_deadline
+
+
+def analyze_task_set(task_set: TaskSet, access_protocol: SemaphoreAP = SemaphoreAP.PIP) -> int:
+    """the Verdict of a single task set"""
+    return int(analyze([task_set], access_protocol).verdicts[0])
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+batch.py - simulate many task set files under several access protocols in parallel
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from taskSet import TaskSet
+from semaphore import SemaphoreAP
+from simulator import Simulator
+from analysis import analyze, Verdict
+from resultCache import ResultCache
+
+PROTOCOLS = {
+    'SIMPLE': SemaphoreAP.SIMPLE,
+    'HLP': SemaphoreAP.HLP,
+    'PIP': SemaphoreAP.PIP,
+}
+
+SUMMARY_COLUMNS = ['TaskSet', 'Protocol', 'Feasible', 'Misses', 'MaxResponseTime', 'Runtime', 'Method', 'Error']
+
+
+def find_task_sets(pattern: str) -> list[str]:
+    """the JSON files of a directory, or the files matching a glob pattern"""
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.json')
+    return sorted(glob.glob(pattern, recursive=True))
+
+
+def simulate_task_set(file_path: str, task_set: TaskSet, protocol: str, detect_cycle: bool = True,
+                      cache: ResultCache = None) -> dict:
+    """summary row of one parsed task set under one protocol, from cache if given and it holds the result
+
+    Rows served by the cache have Method 'cache', their Runtime being the lookup's.
+    """
+    start = time.perf_counter()
+    method = 'simulation'
+    try:
+        if cache is not None:
+            hits = cache.hits
+            result = cache.simulate(task_set, PROTOCOLS[protocol], detect_cycle=detect_cycle)
+            if cache.hits > hits:
+                method = 'cache'
+        else:
+            result = Simulator(task_set, PROTOCOLS[protocol], record_trace=False, detect_cycle=detect_cycle).run()
+    except (KeyError, ValueError, TypeError, IndexError) as error:
+        return dict(TaskSet=file_path, Protocol=protocol, Error=repr(error))
+    return dict(TaskSet=file_path, Protocol=protocol, Feasible=result.feasible, Misses=result.missCount,
+                MaxResponseTime=max(result.maxResponseTimes.values(), default=0),
+                Runtime=time.perf_counter() - start, Method=method, Error='')
+
+
+def analyze_task_sets(file_paths: list[str], datas: list, protocol: str) -> list[dict | None]:
+    """summary rows for the task sets the analysis decides, None for the ones left to simulate"""
+    start = time.perf_counter()
+    try:
+        verdicts = analyze([TaskSet(data, build_jobs=False) for data in datas], PROTOCOLS[protocol]).verdicts
+    except (KeyError, ValueError, TypeError, IndexError):
+        return [None] * len(datas)
+    runtime = (time.perf_counter() - start) / max(len(datas), 1)
+    return [None if verdict == Verdict.UNKNOWN else
+            dict(TaskSet=file_path, Protocol=protocol, Feasible=bool(verdict == Verdict.SCHEDULABLE),
+                 Runtime=runtime, Method='analysis', Error='')
+            for file_path, verdict in zip(file_paths, verdicts)]
+
+
+def simulate_chunk(file_paths: list[str], protocols: list[str], detect_cycle: bool = True,
+                   prefilter: bool = False, cache_dir: str = None) -> list[dict]:
+    """summary rows of some task set files, one per file and protocol
+
+    With prefilter, the whole chunk first goes through the vectorized analysis for each protocol
+    and only the task sets it cannot decide are simulated. With cache_dir, simulation results
+    are looked up in and added to a ResultCache there.
+    """
+    cache = ResultCache(cache_dir) if cache_dir is not None else None
+    rows: dict[tuple[str, str], dict] = {}
+    loaded_paths = []
+    datas = []
+    for file_path in file_paths:
+        try:
+            with open(file_path) as json_data:
+                datas.append(json.load(json_data))
+            loaded_paths.append(file_path)
+        except (OSError, ValueError) as error:
+            for protocol in protocols:
+                rows[file_path, protocol] = dict(TaskSet=file_path, Protocol=protocol, Error=str(error))
+
+    if prefilter:
+        for protocol in protocols:
+            for file_path, row in zip(loaded_paths, analyze_task_sets(loaded_paths, datas, protocol)):
+                if row is not None:
+                    rows[file_path, protocol] = row
+
+    for file_path, data in zip(loaded_paths, datas):
+        remaining = [protocol for protocol in protocols if (file_path, protocol) not in rows]
+        if len(remaining) == 0:
+            continue
+        try:
+            task_set = TaskSet(data, build_jobs=False, integer_time=True)  # parsed once for every protocol
+        except (KeyError, ValueError, TypeError, IndexError) as error:
+            for protocol in remaining:
+                rows[file_path, protocol] = dict(TaskSet=file_path, Protocol=protocol, Error=repr(error))
+            continue
+        for protocol in remaining:
+            rows[file_path, protocol] = simulate_task_set(file_path, task_set, protocol, detect_cycle, cache)
+
+    return [rows[file_path, protocol] for file_path in file_paths for protocol in protocols]
+
+
+def run_batch(file_paths: list[str], protocols: list[str] = None, workers: int = None, chunk_size: int = 0,
+              detect_cycle: bool = True, prefilter: bool = False, cache_dir: str = None) -> list[dict]:
+    """simulate every file under every protocol over a process pool, rows come back in input order
+
+    Files are handed to the workers in chunks of chunk_size (by default enough for about four
+    chunks per worker) so that pickling and scheduling overhead stays small next to the work.
+    """
+    if protocols is None:
+        protocols = list(PROTOCOLS.keys())
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunk_size <= 0:
+        chunk_size = max(1, len(file_paths) // (workers * 4))
+
+    chunks = [file_paths[i:i + chunk_size] for i in range(0, len(file_paths), chunk_size)]
+    rows = []
+    if workers == 1:
+        for chunk in chunks:
+            rows.extend(simulate_chunk(chunk, protocols, detect_cycle, prefilter, cache_dir))
+        return rows
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(simulate_chunk, chunk, protocols, detect_cycle, prefilter, cache_dir)
+                   for chunk in chunks]
+        for future in futures:
+            rows.extend(future.result())
+    return rows
+
+
+def write_summary(rows: list[dict], output) -> None:
+    writer = csv.DictWriter(output, fieldnames=SUMMARY_COLUMNS, restval='')
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('task_sets', nargs='+', help='task set JSON files, directories or glob patterns')
+    parser.add_argument('-p', '--protocols', nargs='+', choices=list(PROTOCOLS.keys()),
+                        default=list(PROTOCOLS.keys()))
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('-c', '--chunk-size', type=int, default=0, help='files per work item')
+    parser.add_argument('-o', '--output', default=None, help='summary CSV path (default: stdout)')
+    parser.add_argument('--no-cycle', action='store_true', help='always simulate up to endTime')
+    parser.add_argument('--prefilter', action='store_true',
+                        help='skip the simulation of task sets that schedulability analysis decides')
+    parser.add_argument('--cache', default=None, metavar='DIR',
+                        help='reuse the simulation results cached in this directory and add the new ones')
+    args = parser.parse_args()
+
+    file_paths = []
+    for pattern in args.task_sets:
+        file_paths.extend(find_task_sets(pattern))
+
+    rows = run_batch(file_paths, args.protocols, args.workers, args.chunk_size, not args.no_cycle, args.prefilter,
+                     args.cache)
+    if args.output is None:
+        write_summary(rows, sys.stdout)
+    else:
+        with open(args.output, 'w', newline='') as output:
+            write_summary(rows, output)
+
+
+if __name__ == "__main__":
+    main()
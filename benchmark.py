@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+benchmark.py - scalability benchmarks of parsing, job building and simulation on synthetic task sets
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+import tracemalloc
+
+from taskSet import TaskSet
+from semaphore import SemaphoreAP
+from simulator import Simulator
+from generator import generate_task_set
+
+# (name, swept parameter, values)
+SWEEPS = [
+    ('tasks', 'task_count', [5, 10, 20, 50, 100]),
+    ('horizon', 'end_time', [1000, 10000, 100000]),
+    ('contention', 'resource_count', [0, 1, 2, 4, 8]),
+]
+
+DEFAULTS = dict(task_count=10, utilization=0.7, end_time=10000, resource_count=2, critical_ratio=0.5)
+
+CHECKPOINT_FRACTIONS = [0.1, 0.5, 0.9]  # of the horizon, where checkpoint() is timed
+CHECKPOINT_GROWTH = 3.0  # largest ratio of the latest to the earliest checkpoint time that passes
+
+
+def measure(data: dict, access_protocol: SemaphoreAP, repeat: int) -> dict:
+    """best-of-repeat timings of one task set, plus the peak memory of one lazy simulation"""
+    text = json.dumps(data)
+    parse_time = build_time = simulate_time = float('inf')
+    events = jobs = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            json.loads(text)
+            parse_time = min(parse_time, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            task_set = TaskSet(data)
+            build_time = min(build_time, time.perf_counter() - start)
+            jobs = len(task_set.jobs)
+
+            simulator = Simulator(TaskSet(data, build_jobs=False), access_protocol, record_trace=False)
+            start = time.perf_counter()
+            simulator.run()
+            simulate_time = min(simulate_time, time.perf_counter() - start)
+            events = simulator.eventCount
+
+        tracemalloc.start()
+        Simulator(TaskSet(data, build_jobs=False), access_protocol, record_trace=False).run()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return dict(parse=parse_time, build=build_time, simulate=simulate_time, jobs=jobs, events=events,
+                events_per_second=events / simulate_time if simulate_time > 0 else 0, peak_memory=peak_memory)
+
+
+def measure_checkpoints(data: dict, access_protocol: SemaphoreAP, repeat: int) -> list[dict]:
+    """best-of-repeat time of one checkpoint at CHECKPOINT_FRACTIONS of the horizon, with metrics recorded
+
+    A checkpoint only copies the pending state, so its time should stay flat however long the
+    simulation has run.
+    """
+    rows = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        task_set = TaskSet(data, build_jobs=False)
+        simulator = Simulator(task_set, access_protocol, record_trace=False, record_metrics=True)
+        for fraction in CHECKPOINT_FRACTIONS:
+            simulator.run_until(task_set.startTime + fraction * (task_set.endTime - task_set.startTime))
+            checkpoint_time = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                simulator.checkpoint()
+                checkpoint_time = min(checkpoint_time, time.perf_counter() - start)
+            rows.append(dict(time=simulator.currTime * task_set.tick, checkpoint=checkpoint_time,
+                             jobs=len(simulator.metrics.jobs)))
+    return rows
+
+
+def run_benchmarks(sweeps: list = None, access_protocol: SemaphoreAP = SemaphoreAP.PIP, repeat: int = 3,
+                   seed: int = 0) -> list[dict]:
+    rows = []
+    for name, parameter, values in sweeps if sweeps is not None else SWEEPS:
+        for value in values:
+            options = dict(DEFAULTS)
+            options[parameter] = value
+            data = generate_task_set(options['task_count'], options['utilization'], seed,
+                                     resource_count=options['resource_count'],
+                                     critical_ratio=options['critical_ratio'], end_time=options['end_time'])
+            row = dict(sweep=name, value=value)
+            row.update(measure(data, access_protocol, repeat))
+            rows.append(row)
+    return rows
+
+
+def print_rows(rows: list[dict]) -> None:
+    print(f"{'sweep':<12}{'value':>8}{'jobs':>10}{'events':>10}{'parse ms':>10}{'build ms':>10}"
+          f"{'sim ms':>10}{'events/s':>12}{'peak KiB':>10}")
+    for row in rows:
+        print(f"{row['sweep']:<12}{row['value']:>8}{row['jobs']:>10}{row['events']:>10}"
+              f"{row['parse'] * 1000:>10.2f}{row['build'] * 1000:>10.2f}{row['simulate'] * 1000:>10.2f}"
+              f"{row['events_per_second']:>12.0f}{row['peak_memory'] / 1024:>10.1f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-p', '--protocol', choices=['SIMPLE', 'HLP', 'PIP'], default='PIP')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('--sweep', choices=[sweep[0] for sweep in SWEEPS], nargs='+', default=None,
+                        help='run only these sweeps')
+    parser.add_argument('--json', default=None, help='also write the results to this JSON file')
+    parser.add_argument('--checkpoints', type=int, default=None, metavar='END_TIME',
+                        help='instead, check that the time per checkpoint stays flat over this horizon; '
+                             'exit status 1 if not')
+    args = parser.parse_args()
+
+    if args.checkpoints is not None:
+        data = generate_task_set(DEFAULTS['task_count'], DEFAULTS['utilization'], args.seed,
+                                 resource_count=DEFAULTS['resource_count'],
+                                 critical_ratio=DEFAULTS['critical_ratio'], end_time=args.checkpoints)
+        rows = measure_checkpoints(data, getattr(SemaphoreAP, args.protocol), args.repeat)
+        print(f"{'time':>10}{'metrics':>10}{'checkpoint ms':>15}")
+        for row in rows:
+            print(f"{row['time']:>10g}{row['jobs']:>10}{row['checkpoint'] * 1000:>15.3f}")
+        growth = rows[-1]['checkpoint'] / rows[0]['checkpoint']
+        print(f"growth {growth:.2f} (at most {CHECKPOINT_GROWTH:g})")
+        return 0 if growth <= CHECKPOINT_GROWTH else 1
+
+    sweeps = [sweep for sweep in SWEEPS if args.sweep is None or sweep[0] in args.sweep]
+    rows = run_benchmarks(sweeps, getattr(SemaphoreAP, args.protocol), args.repeat, args.seed)
+    print_rows(rows)
+    if args.json is not None:
+        with open(args.json, 'w') as output:
+            json.dump(rows, output, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
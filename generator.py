@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+generator.py - seeded generator of synthetic task sets in the JSON format of taskset.json
+"""
+
+import argparse
+import json
+import math
+import random
+
+from task import TaskSetJsonKeys as TSJK
+
+
+def uunifast(task_count: int, utilization: float, rng: random.Random) -> list[float]:
+    """task utilizations summing to utilization, uniformly distributed (Bini & Buttazzo)"""
+    utilizations = []
+    remaining = utilization
+    for i in range(1, task_count):
+        next_remaining = remaining * rng.random() ** (1 / (task_count - i))
+        utilizations.append(remaining - next_remaining)
+        remaining = next_remaining
+    utilizations.append(remaining)
+    return utilizations
+
+
+def log_uniform_period(rng: random.Random, min_period: float, max_period: float, granularity: float) -> float:
+    period = math.exp(rng.uniform(math.log(min_period), math.log(max_period)))
+    return max(granularity, round(period / granularity) * granularity)
+
+
+def split_sections(wcet: float, section_count: int, resource_count: int, critical_ratio: float,
+                   rng: random.Random, granularity: float) -> list[list]:
+    """cut wcet into section_count sections, each a critical section with probability critical_ratio"""
+    units = max(1, round(wcet / granularity))
+    section_count = max(1, min(section_count, units))
+    cuts = sorted(rng.sample(range(1, units), section_count - 1))
+    bounds = [0] + cuts + [units]
+    sections = []
+    for start, end in zip(bounds, bounds[1:]):
+        resource = 0
+        if resource_count > 0 and rng.random() < critical_ratio:
+            resource = rng.randint(1, resource_count)
+        sections.append([resource, (end - start) * granularity])
+    return sections
+
+
+def generate_task_set(task_count: int, utilization: float, seed: int = 0, min_period: float = 10,
+                      max_period: float = 1000, resource_count: int = 2, sections_per_task: int = 3,
+                      critical_ratio: float = 0.5, end_time: float = None, offsets: bool = True,
+                      granularity: float = 1) -> dict:
+    """a task set dict ready for json.dump and TaskSet
+
+    Times are multiples of granularity, so rounding moves the total utilization slightly away
+    from the requested one. The schedule window defaults to twice the longest period.
+    """
+    rng = random.Random(seed)
+    tasks = []
+    for task_id, task_utilization in enumerate(uunifast(task_count, utilization, rng), start=1):
+        period = log_uniform_period(rng, min_period, max_period, granularity)
+        wcet = max(granularity, round(task_utilization * period / granularity) * granularity)
+        sections = split_sections(wcet, rng.randint(1, sections_per_task), resource_count, critical_ratio, rng,
+                                  granularity)
+        tasks.append({
+            TSJK.KEY_TASK_ID: task_id,
+            TSJK.KEY_TASK_PERIOD: period,
+            TSJK.KEY_TASK_WCET: sum(section[1] for section in sections),
+            TSJK.KEY_TASK_DEADLINE: period,
+            TSJK.KEY_TASK_OFFSET: rng.randrange(0, int(period / granularity)) * granularity if offsets else 0,
+            TSJK.KEY_TASK_SECTIONS: sections,
+        })
+
+    if end_time is None:
+        end_time = 2 * max(task[TSJK.KEY_TASK_PERIOD] for task in tasks)
+    return {
+        TSJK.KEY_SCHEDULE_START: 0,
+        TSJK.KEY_SCHEDULE_END: end_time,
+        TSJK.KEY_TASKSET: tasks,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('output', help='output path, {seed} is replaced when generating several task sets')
+    parser.add_argument('-n', '--tasks', type=int, default=10)
+    parser.add_argument('-u', '--utilization', type=float, default=0.7)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('--count', type=int, default=1, help='number of task sets, with consecutive seeds')
+    parser.add_argument('--min-period', type=float, default=10)
+    parser.add_argument('--max-period', type=float, default=1000)
+    parser.add_argument('-r', '--resources', type=int, default=2)
+    parser.add_argument('--sections', type=int, default=3, help='maximum number of sections per task')
+    parser.add_argument('--critical-ratio', type=float, default=0.5, help='probability a section is critical')
+    parser.add_argument('--end-time', type=float, default=None)
+    parser.add_argument('--no-offsets', action='store_true')
+    args = parser.parse_args()
+
+    for seed in range(args.seed, args.seed + args.count):
+        data = generate_task_set(args.tasks, args.utilization, seed, args.min_period, args.max_period,
+                                 args.resources, args.sections, args.critical_ratio, args.end_time,
+                                 not args.no_offsets)
+        with open(args.output.format(seed=seed), 'w') as output:
+            json.dump(data, output, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from semaphore import SemaphoreSet, EMPTY_SEM_SET
-from copy import deepcopy
+from jobQueue import JobQueue, EMPTY_JOB_QUEUE
 
 
 class JobState:
@@ -14,21 +14,34 @@ class JobState:
 
 
 class Job(object):
+    """A release of a task.
+
+    The sections are the task's shared, immutable section table; progress through them is kept
+    in currSectionIdx and sectionRemaining, the time left in the current section.
+    """
+
+    __slots__ = ['state', 'id', 'releaseTime', 'readyQueue', 'waitingQueue', 'currSectionIdx', 'sectionRemaining',
+                 'semaphores', 'gotLock', 'remaining_execution_time', 'deadline', 'originalPriority', 'priority',
+                 'sections', 'task', 'blockedOn', 'boosts']
+
     def __init__(self, task, job_id=0, release_time=0):
 
         self.state = JobState.CREATED
         self.id = job_id
         self.releaseTime = release_time
-        self.readyQueue: list[Job] = []
-        self.waitingQueue: list[Job] = []
+        self.readyQueue: JobQueue = EMPTY_JOB_QUEUE
+        self.waitingQueue: JobQueue = EMPTY_JOB_QUEUE
         self.currSectionIdx = 0
+        self.sectionRemaining = 0
         self.semaphores: SemaphoreSet = EMPTY_SEM_SET
         self.gotLock: bool = False
+        self.blockedOn = None  # the Semaphore this job is queued on
+        self.boosts = 0  # times the access protocol raised its priority
         self.remaining_execution_time = 0
         self.deadline = release_time
         self.originalPriority = 0
         self.priority = 0
-        self.sections = []
+        self.sections: tuple[tuple[int, float], ...] = ()
 
         if task is not None:
             self.task = task
@@ -36,10 +49,28 @@ class Job(object):
             self.deadline = release_time + task.relativeDeadline
             self.originalPriority = task.relativeDeadline
             self.priority = self.originalPriority
-            self.sections = deepcopy(task.sections)
+            self.sections = task.sectionTable
+            if len(self.sections) > 0:
+                self.sectionRemaining = self.sections[0][1]
         else:
             self.task = None
 
+    def reset(self) -> None:
+        """re-read the parameters of the task, for a job that has not been released yet"""
+        self.__init__(self.task, self.id, self.releaseTime)
+
+    def set_base_priority(self, priority: float) -> None:
+        """replace the priority taken from the task, before the job is released"""
+        self.originalPriority = priority
+        self.priority = priority
+
+    def set_sections(self, sections: tuple[tuple[int, float], ...]) -> None:
+        """replace the sections (and so the execution time) taken from the task, before the job is released"""
+        self.sections = sections
+        self.remaining_execution_time = sum(length for _, length in sections)
+        if len(sections) > 0:
+            self.sectionRemaining = sections[0][1]
+
     def get_resources_held(self) -> int:
         """the resources that it's currently holding"""
         if self.state in [JobState.READY, JobState.RUNNING, JobState.SUSPENDED]:
@@ -65,18 +96,23 @@ class Job(object):
 
     def update_queue(self):
         if self.state == JobState.READY:
-            self.readyQueue.sort()
+            self.readyQueue.update(self)
         elif self.state == JobState.BLOCKED:
-            self.waitingQueue.sort()
+            self.waitingQueue.update(self)
+        if self.blockedOn is not None:
+            self.blockedOn.waiters.update(self)
 
     def elevate_priority(self, new_priority: float) -> None:
         if new_priority < self.priority:
             self.priority = new_priority
+            self.boosts += 1
             self.update_queue()
             # print(f"Priority of {self.short_form()} elevated to {new_priority}")
 
     def revert_priority(self, new_priority: float) -> None:
         if 0 <= new_priority < self.originalPriority:
+            if new_priority < self.priority:
+                self.boosts += 1
             self.priority = new_priority
             self.update_queue()
             # print(f"Priority of {self.short_form()} reverted to {new_priority}")
@@ -87,16 +123,15 @@ class Job(object):
 
     def get_remaining_section_time(self) -> int:
         if self.remaining_execution_time > 0:
-            return self.sections[self.currSectionIdx][1]
+            return self.sectionRemaining
         else:
             return 0
 
-    def release(self, semaphores: SemaphoreSet, ready_queue: list[Job], waiting_queue: list[Job]) -> None:
+    def release(self, semaphores: SemaphoreSet, ready_queue: JobQueue, waiting_queue: JobQueue) -> None:
         self.semaphores = semaphores
-        self.readyQueue: list[Job] = ready_queue
-        self.waitingQueue: list[Job] = waiting_queue
-        self.readyQueue.append(self)
-        self.readyQueue.sort()
+        self.readyQueue = ready_queue
+        self.waitingQueue = waiting_queue
+        self.readyQueue.push(self)
         self.state = JobState.READY
 
     def end(self) -> int:
@@ -109,33 +144,65 @@ class Job(object):
             self.state = JobState.ABORTED
         else:
             self.state = JobState.ENDED
-        self.readyQueue = []
-        self.waitingQueue = []
+        self.readyQueue = EMPTY_JOB_QUEUE
+        self.waitingQueue = EMPTY_JOB_QUEUE
         self.semaphores = EMPTY_SEM_SET
         if self.state == JobState.ENDED:
             return 0
         return -1
 
+    def wake(self) -> None:
+        if self.state == JobState.BLOCKED:
+            self.waitingQueue.remove(self)
+            self.readyQueue.push(self)
+            self.state = JobState.READY
+
     def unblock(self) -> None:
-        self.waitingQueue.remove(self)
-        self.readyQueue.append(self)
-        self.state = JobState.READY
-        self.readyQueue.sort()
+        self.wake()
         self.gotLock = True
 
+    def is_started(self) -> bool:
+        return self.currSectionIdx > 0 or self.sectionRemaining < self.sections[0][1]
+
+    def acquire(self) -> bool:
+        """take the resource of the current section, False while the job has to wait for it
+
+        A job that has to suspend moves to the waiting queue. A job waiting on a spin lock stays
+        ready and queued on the semaphore until the lock is handed to it. Under SRP, a job that
+        may not start yet waits in the waiting queue until the semaphores wake it.
+        """
+        if self.gotLock:
+            return True
+        if self.blockedOn is not None:
+            return False
+        if not self.is_started() and not self.semaphores.admit(self):
+            self.readyQueue.remove(self)
+            self.waitingQueue.push(self)
+            self.state = JobState.BLOCKED
+            return False
+        resource = self.sections[self.currSectionIdx][0]
+        if self.semaphores.wait(resource, self) == 0:
+            self.gotLock = True
+            return True
+        if not self.semaphores.spins(resource):
+            self.readyQueue.remove(self)
+            self.waitingQueue.push(self)
+            self.state = JobState.BLOCKED
+        return False
+
     def execute(self, time: float) -> tuple[float, int]:
         # print(f'Execute ({time}) job {self.task.id}:{self.id}')
-        passed_time = 0
         curr_section = self.sections[self.currSectionIdx]
-        progression_time = min(curr_section[1], time)
+        progression_time = min(self.sectionRemaining, time)
         resource = curr_section[0]
-        if self.gotLock or self.semaphores.wait(resource, self) == 0:
-            self.gotLock = True
+        if self.acquire():
             # print(f'got lock {curr_section[0]}')
             self.remaining_execution_time -= progression_time
-            curr_section[1] -= progression_time
-            if curr_section[1] == 0:
+            self.sectionRemaining -= progression_time
+            if self.sectionRemaining == 0:
                 self.currSectionIdx += 1
+                if self.currSectionIdx < len(self.sections):
+                    self.sectionRemaining = self.sections[self.currSectionIdx][1]
                 res = self.semaphores.signal(resource, self)
                 if res >= 0:
                     self.gotLock = False
@@ -144,9 +211,6 @@ class Job(object):
                     print("!!!Freeing A Semaphore that was Not taken!!!")
 
         else:
-            self.readyQueue.remove(self)
-            self.waitingQueue.append(self)
-            self.state = JobState.BLOCKED
             progression_time = 0
 
         if self.remaining_execution_time == 0:
@@ -157,7 +221,7 @@ class Job(object):
 
     def execute_to_completion(self) -> tuple[float, int]:
         if self.remaining_execution_time > 0:
-            return self.execute(self.sections[self.currSectionIdx][1])
+            return self.execute(self.sectionRemaining)
         else:
             return 0, 0
     def is_completed(self) -> bool:
@@ -167,8 +231,9 @@ class Job(object):
             return True
 
     def __str__(self) -> str:
-        return "[{0}:{1}] released at {2} -> deadline at {3}".format(self.task.id, self.id, self.releaseTime,
-                                                                     self.deadline)
+        return "[{0}:{1}] released at {2} -> deadline at {3}".format(self.task.id, self.id,
+                                                                     self.releaseTime * self.task.tick,
+                                                                     self.deadline * self.task.tick)
 
     def short_form(self) -> str:
         return f'Job[{self.task.id}:{self.id}]'
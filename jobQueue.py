@@ -0,0 +1,118 @@
+from __future__ import annotations
+import heapq
+
+
+class JobQueue(object):
+    """Binary min-heap of jobs keyed by priority, with a position index per job.
+
+    Ties are broken the way appending to a list and stable-sorting it would: a pushed
+    job goes behind the jobs of equal priority, a job whose priority is raised goes
+    behind its new peers, and a job whose priority is lowered goes in front of them.
+    """
+
+    def __init__(self):
+        self.heap: list[list] = []  # entries are [priority, order, job]
+        self.index: dict[Job, int] = {}
+        self.order = 0
+        self.front = 0
+
+    def push(self, job: Job) -> None:
+        self.order += 1
+        self.heap.append([job.get_priority(), self.order, job])
+        self.index[job] = len(self.heap) - 1
+        self.sift_up(len(self.heap) - 1)
+
+    def peek(self) -> Job:
+        return self.heap[0][2]
+
+    def pop(self) -> Job:
+        job = self.heap[0][2]
+        self.remove(job)
+        return job
+
+    def remove(self, job: Job) -> None:
+        pos = self.index.pop(job)
+        last = self.heap.pop()
+        if pos < len(self.heap):
+            self.heap[pos] = last
+            self.index[last[2]] = pos
+            self.sift_up(pos)
+            self.sift_down(self.index[last[2]])
+
+    def update(self, job: Job) -> None:
+        """re-position a job after its priority has changed"""
+        pos = self.index.get(job)
+        if pos is None:
+            return
+        entry = self.heap[pos]
+        old_priority = entry[0]
+        entry[0] = job.get_priority()
+        if entry[0] < old_priority:
+            self.order += 1
+            entry[1] = self.order
+            self.sift_up(pos)
+        elif entry[0] > old_priority:
+            self.front -= 1
+            entry[1] = self.front
+            self.sift_down(pos)
+
+    def less(self, i: int, j: int) -> bool:
+        a = self.heap[i]
+        b = self.heap[j]
+        return a[0] < b[0] or (a[0] == b[0] and a[1] < b[1])
+
+    def swap(self, i: int, j: int) -> None:
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.index[heap[i][2]] = i
+        self.index[heap[j][2]] = j
+
+    def sift_up(self, pos: int) -> None:
+        while pos > 0:
+            parent = (pos - 1) >> 1
+            if not self.less(pos, parent):
+                break
+            self.swap(pos, parent)
+            pos = parent
+
+    def sift_down(self, pos: int) -> None:
+        size = len(self.heap)
+        while True:
+            child = 2 * pos + 1
+            if child >= size:
+                break
+            if child + 1 < size and self.less(child + 1, child):
+                child += 1
+            if not self.less(child, pos):
+                break
+            self.swap(pos, child)
+            pos = child
+
+    def smallest(self, count: int) -> list[Job]:
+        """the count highest priority jobs in the order they would be popped, in O(count log count)"""
+        jobs = []
+        candidates = [((self.heap[0][0], self.heap[0][1]), 0)] if len(self.heap) > 0 else []
+        while len(candidates) > 0 and len(jobs) < count:
+            _, pos = heapq.heappop(candidates)
+            jobs.append(self.heap[pos][2])
+            for child in (2 * pos + 1, 2 * pos + 2):
+                if child < len(self.heap):
+                    heapq.heappush(candidates, ((self.heap[child][0], self.heap[child][1]), child))
+        return jobs
+
+    def ordered(self) -> list[Job]:
+        """jobs in the order they would be popped"""
+        return [entry[2] for entry in sorted(self.heap, key=lambda entry: (entry[0], entry[1]))]
+
+    def __contains__(self, job: Job) -> bool:
+        return job in self.index
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def __iter__(self):
+        """jobs in heap order, not priority order"""
+        return (entry[2] for entry in self.heap)
+
+
+EMPTY_JOB_QUEUE = JobQueue()
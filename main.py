@@ -3,111 +3,131 @@
 main.py - parser for task set from JSON file
 """
 
+import argparse
 import json
 import sys
-import plotly.express as px
-import pandas as pd
 
-from job import Job, EMPTY_JOB
-from task import Task, EMPTY_TASK
-from task import TaskSetJsonKeys as TSJK
-from taskSet import TaskSet, EventType
-from semaphore import SemaphoreSet, SemaphoreAP
+from taskSet import TaskSet
+from releaseLog import ReleaseLog
+from semaphore import SemaphoreAP
+from simulator import Simulator, SimulationResult, MissCheck, SchedulingPolicy
 
+PROTOCOLS = ['SIMPLE', 'HLP', 'PIP', 'SRP']
 
-def main() -> None:
-    if len(sys.argv) > 1:
-        file_path = sys.argv[1]
-    else:
-        file_path = "taskset1.json"
 
-    with open(file_path) as json_data:
-        data = json.load(json_data)
+def result_to_dict(result: SimulationResult, tick: float = 1) -> dict:
+    return dict(feasible=result.feasible, missCount=result.missCount, endTime=result.endTime,
+                firstMissTime=result.firstMissTime,
+                deadlineMisses=[dict(task=job.task.id, job=job.id, deadline=job.get_deadline() * tick)
+                                for job in result.deadlineMisses],
+                maxResponseTimes=result.maxResponseTimes, executedTime=result.executedTime)
+
 
-    feasible = True
-    task_set = TaskSet(data)
-    task_set.print_tasks()
-    task_set.print_jobs()
-    task_set.print_events()
-
-    resources = task_set.get_all_resources()
-    event_list = task_set.get_event_list()
-    curr_event = 0
-    events: dict[float, list[tuple[EventType, Job]]] = task_set.get_events()
-    ready_queue: list[Job] = []
-    waiting_queue: list[Job] = []
-    highest_priorities = task_set.get_highest_priorities()
-    semaphores = SemaphoreSet(resources, access_protocol=SemaphoreAP.SIMPLE, resources_highest_priority=highest_priorities)
-    schedule = pd.DataFrame([])
-
-    event_count = len(event_list)
-    for i in range(event_count - 1):
-        event_time = event_list[i]
-        # print(f'Current Time: {event_time}')
-        next_event_time = event_list[i + 1]
-        for event in events[event_time]:
-            if event[0] == EventType.RELEASE:
-                event[1].release(semaphores, ready_queue, waiting_queue)
-            elif event[0] == EventType.DEADLINE:
-                if event[1].end() == -1:
-                    feasible = False
-
-        curr_time = event_time
-
-        while curr_time < next_event_time:
-            # print(f'Ready Queue Length is {len(ready_queue)} @ t = {curr_time}')
-            if len(ready_queue) == 0:
-                # schedule.append((curr_time, next_event_time, EMPTY_JOB, 0))
-                curr_time = next_event_time
-            else:
-                selected_job = ready_queue[0]
-                progression, resource = selected_job.execute(next_event_time - curr_time)
-                # if progression == 0:
-                #     print("BLOCKED!")
-                if progression > 0:
-                    edited = False
-                    if not schedule.empty:
-                        progress = schedule.loc[schedule.index[-1]]
-                        if (progress.at['Resource'] == str(resource) and progress['Task'] == selected_job.task.id and
-                                progress['Job'] == selected_job.id and progress['End'] == curr_time):
-                            schedule.at[schedule.index[-1], 'End'] = curr_time + progression
-                            edited = True
-                    if not edited:
-                        task_id = 0
-                        job_id = 0
-                        if selected_job.task != EMPTY_JOB:
-                            task_id = selected_job.task.id
-                            job_id = selected_job.id
-                        new_row = pd.DataFrame([
-                            dict(Start=curr_time, End=curr_time + progression, Task=task_id, Job=job_id,
-                                 Resource=str(resource))
-                        ])
-                        schedule = pd.concat([schedule, new_row], ignore_index=True)
-                curr_time += progression
-
-    print("\nSchedule:")
-    print(schedule)
-    if feasible:
-        print("\nThis Task-set is Feasible")
-    else:
-        print("\nThis Task-set is Not Feasible")
+def plot_schedule(schedule, task_set: TaskSet, html_path: str = None, png_path: str = None,
+                  show: bool = True) -> None:
+    """Gantt chart of a schedule DataFrame, plotly and pandas are only imported here"""
+    import pandas as pd
+    import plotly.express as px
 
+    range_set_rows = []
     for task in task_set:
-        range_set_row = pd.DataFrame([
-            dict(Start=0, End=0, Task=task.id, Job=0, Resource=str(0))
-        ])
-        schedule = pd.concat([schedule, range_set_row], ignore_index=True)
-        for resource in resources:
-            range_set_row = pd.DataFrame([
-                dict(Start=0, End=0, Task=task.id, Job=0, Resource=str(resource))
-            ])
-            schedule = pd.concat([schedule, range_set_row], ignore_index=True)
+        for resource in [0] + task_set.get_all_resources():
+            range_set_rows.append(dict(Start=0, End=0, Task=task.id, Job=0, Resource=str(resource)))
+    schedule = pd.concat([schedule, pd.DataFrame(range_set_rows)], ignore_index=True)
 
     schedule['Time'] = schedule['End'] - schedule['Start']
     fig = px.bar(schedule, base="Start", x="Time", y="Task", color="Resource", orientation='h')
     fig.update_yaxes(autorange="reversed")
-    fig.show()
+    if html_path is not None:
+        fig.write_html(html_path)
+    if png_path is not None:
+        fig.write_image(png_path)  # needs kaleido
+    if show:
+        fig.show()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('task_set', nargs='?', default="taskset1.json", help='task set JSON file')
+    parser.add_argument('-r', '--releases', default=None,
+                        help='stream the release times from this NDJSON, CSV or binary release log instead')
+    parser.add_argument('-p', '--protocol', choices=PROTOCOLS, default='SIMPLE')
+    parser.add_argument('--edf', action='store_true', help='schedule by earliest deadline instead of deadline monotonic')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not print the task set, its jobs, events and the schedule')
+    parser.add_argument('-f', '--feasibility', action='store_true',
+                        help='only print whether the task set is feasible, stopping at the first deadline miss; '
+                             'exit status 1 if not')
+    parser.add_argument('--laxity', action='store_true',
+                        help='with --feasibility, stop as soon as a job can no longer meet its deadline')
+    parser.add_argument('-m', '--metrics', action='store_true',
+                        help='print per-task response, blocking and preemption metrics, and add per-job ones to --json')
+    parser.add_argument('--json', default=None, help="write the result as JSON to this path ('-' for stdout)")
+    parser.add_argument('--html', default=None, help='save the schedule chart as HTML')
+    parser.add_argument('--png', default=None, help='save the schedule chart as PNG')
+    parser.add_argument('--no-plot', action='store_true', help='do not open the schedule chart')
+    parser.add_argument('--gantt', default=None,
+                        help='save a level-of-detail schedule chart as static HTML, for traces too large to plot')
+    args = parser.parse_args()
+    if args.edf and args.protocol == 'HLP':
+        parser.error("HLP needs fixed priorities, use SRP with --edf")
+
+    with open(args.task_set) as json_data:
+        data = json.load(json_data)
+
+    quiet = args.quiet or args.feasibility
+    releases = ReleaseLog(args.releases) if args.releases is not None else None
+    task_set = TaskSet(data, build_jobs=not quiet, releases=releases)
+    if not quiet:
+        task_set.print_tasks()
+        task_set.print_jobs()
+        task_set.print_events()
+
+    export = args.html is not None or args.png is not None
+    show = not (quiet or args.no_plot or export)
+    needs_trace = not quiet or export or args.gantt is not None
+    stop_at_miss = MissCheck.NONE
+    if args.feasibility:
+        stop_at_miss = MissCheck.LAXITY if args.laxity else MissCheck.DEADLINE
+    policy = SchedulingPolicy.EDF if args.edf else SchedulingPolicy.DEADLINE_MONOTONIC
+    simulator = Simulator(task_set, access_protocol=getattr(SemaphoreAP, args.protocol), record_trace=needs_trace,
+                          record_metrics=args.metrics, stop_at_miss=stop_at_miss, policy=policy)
+    result = simulator.run()
+    output = result_to_dict(result, task_set.tick)
+    if result.metrics is not None:
+        output['metrics'] = dict(jobs=result.metrics.job_rows(), contextSwitches=result.metrics.contextSwitches)
+
+    if not quiet:
+        print("\nSchedule:")
+        print(result.trace.to_dataframe())
+    if args.json is not None:
+        if args.json == '-':
+            json.dump(output, sys.stdout, indent=4)
+            print()
+        else:
+            with open(args.json, 'w') as json_output:
+                json.dump(output, json_output, indent=4)
+    if args.feasibility or args.json != '-':
+        if result.feasible:
+            print("\nThis Task-set is Feasible" if not quiet else "Feasible")
+        else:
+            print("\nThis Task-set is Not Feasible" if not quiet else "Not Feasible")
+            if args.feasibility:
+                print(f"{result.deadlineMisses[0].short_form()} misses its deadline, "
+                      f"detected at {result.firstMissTime}")
+        if result.metrics is not None:
+            result.metrics.print_metrics()
+
+    if args.gantt is not None:
+        from traceIndex import TraceIndex, render_gantt
+        render_gantt(TraceIndex.from_trace(result.trace), args.gantt, title=args.task_set)
+    if show or export:
+        plot_schedule(result.trace.to_dataframe(), task_set, args.html, args.png, show)
+
+    if args.feasibility:
+        return 0 if result.feasible else 1
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
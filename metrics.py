@@ -0,0 +1,187 @@
+from __future__ import annotations
+import copy
+import math
+
+from job import Job, JobState
+
+
+def percentile(values: list[float], q: float) -> float:
+    """nearest-rank percentile of sorted values"""
+    if len(values) == 0:
+        return 0
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+class JobMetrics(object):
+    """What happened to one job, in the simulation's time base.
+
+    blockedTime maps a resource to the time the job spent queued on its semaphore, suspended or
+    spinning. inversionTime is the time the job was pending while a job of lower base priority
+    executed on a processor it could have used. inheritances counts the priority raises the
+    job received from the access protocol.
+    """
+
+    __slots__ = ['taskId', 'jobId', 'release', 'deadline', 'start', 'finish', 'missed', 'blockedTime',
+                 'inversionTime', 'preemptions', 'inheritances']
+
+    def __init__(self, job: Job, release: float):
+        self.taskId = job.task.id
+        self.jobId = job.id
+        self.release = release
+        self.deadline = job.get_deadline()
+        self.start: float | None = None
+        self.finish: float | None = None
+        self.missed = False
+        self.blockedTime: dict[int, float] = {}
+        self.inversionTime = 0
+        self.preemptions = 0
+        self.inheritances = 0
+
+    def get_response_time(self) -> float | None:
+        if self.finish is None:
+            return None
+        return self.finish - self.release
+
+    def to_dict(self, tick: float = 1) -> dict:
+        def scale(value):
+            return value * tick if value is not None else None
+        return dict(Task=self.taskId, Job=self.jobId, Release=scale(self.release), Deadline=scale(self.deadline),
+                    Start=scale(self.start), Finish=scale(self.finish), ResponseTime=scale(self.get_response_time()),
+                    Missed=self.missed, BlockedTime=sum(self.blockedTime.values()) * tick,
+                    InversionTime=self.inversionTime * tick, Preemptions=self.preemptions,
+                    Inheritances=self.inheritances)
+
+
+class TaskMetrics(object):
+    """Aggregate of the job metrics of one task, times converted back from ticks."""
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self, task_id: int, jobs: list[JobMetrics], tick: float = 1):
+        response_times = sorted(job.get_response_time() * tick for job in jobs if job.finish is not None)
+        blocked_times = [sum(job.blockedTime.values()) * tick for job in jobs]
+        self.taskId = task_id
+        self.jobCount = len(jobs)
+        self.completed = len(response_times)
+        self.misses = sum(1 for job in jobs if job.missed)
+        self.maxResponseTime = response_times[-1] if len(response_times) > 0 else 0
+        self.meanResponseTime = sum(response_times) / len(response_times) if len(response_times) > 0 else 0
+        self.responseTimePercentiles = {q: percentile(response_times, q) for q in self.PERCENTILES}
+        self.blockedTime: dict[int, float] = {}
+        for job in jobs:
+            for resource, blocked in job.blockedTime.items():
+                self.blockedTime[resource] = self.blockedTime.get(resource, 0) + blocked * tick
+        self.maxBlockedTime = max(blocked_times, default=0)
+        self.maxInversionTime = max((job.inversionTime * tick for job in jobs), default=0)
+        self.preemptions = sum(job.preemptions for job in jobs)
+        self.maxPreemptions = max((job.preemptions for job in jobs), default=0)
+        self.inheritances = sum(job.inheritances for job in jobs)
+
+    def __str__(self) -> str:
+        percentiles = ', '.join(f'p{q}={value:g}' for q, value in self.responseTimePercentiles.items())
+        return (f"task {self.taskId}: {self.completed}/{self.jobCount} jobs completed, {self.misses} missed, "
+                f"response time max={self.maxResponseTime:g} mean={self.meanResponseTime:g} {percentiles}, "
+                f"blocked max={self.maxBlockedTime:g} {self.blockedTime}, inversion max={self.maxInversionTime:g}, "
+                f"preemptions {self.preemptions} (max {self.maxPreemptions}), inheritances {self.inheritances}")
+
+
+class MetricsRecorder(object):
+    """Per-job instrumentation fed by the simulator.
+
+    The simulator reports releases, deadline misses and every interval in which time advances,
+    with the jobs that executed in it and the pending ones. It only does so when metrics are
+    requested, so a simulation without them pays nothing. Jobs are tracked while pending and
+    kept as JobMetrics afterwards. With cycle detection, only the simulated part of the
+    schedule is covered.
+    """
+
+    def __init__(self, tick: float = 1):
+        self.tick = tick
+        self.jobs: list[JobMetrics] = []
+        self.active: dict[Job, int] = {}  # pending job -> the index of its metrics in jobs
+        self.lastJobs: dict[int, Job] = {}  # the job that last executed on each processor
+        self.running: set[Job] = set()
+        self.contextSwitches = 0
+
+    def on_release(self, job: Job, time: float) -> None:
+        self.active[job] = len(self.jobs)
+        self.jobs.append(JobMetrics(job, time))
+
+    def on_miss(self, job: Job) -> None:
+        index = self.active.pop(job, None)
+        if index is not None:
+            metrics = self.jobs[index]
+            metrics.missed = True
+            metrics.inheritances = job.boosts
+
+    def on_interval(self, start: float, length: float, executed: list[tuple[int, Job]], pending) -> None:
+        """account for time advancing by length, executed are the (processor, job) pairs that ran
+
+        pending yields (processor, job) pairs of the released jobs, with processor None for jobs
+        that may run on any of them.
+        """
+        running = set()
+        floors: dict[int, float] = {}  # lowest base priority executing on each processor
+        for core, job in executed:
+            running.add(job)
+            if self.lastJobs.get(core) is not job:
+                self.contextSwitches += 1
+                self.lastJobs[core] = job
+            floors[core] = job.originalPriority
+            index = self.active.get(job)
+            if index is None:
+                continue
+            metrics = self.jobs[index]
+            if metrics.start is None:
+                metrics.start = start
+            metrics.inheritances = job.boosts
+            if job.state == JobState.ENDED:
+                metrics.finish = start + length
+                del self.active[job]
+
+        for job in self.running - running:
+            index = self.active.get(job)
+            if index is not None and job.state == JobState.READY and job.blockedOn is None:
+                self.jobs[index].preemptions += 1
+        self.running = running
+
+        floor = max(floors.values(), default=None)
+        for core, job in pending:
+            if job in running:
+                continue
+            index = self.active.get(job)
+            if index is None:
+                continue
+            metrics = self.jobs[index]
+            if job.blockedOn is not None:
+                resource = job.blockedOn.semaphore_id
+                metrics.blockedTime[resource] = metrics.blockedTime.get(resource, 0) + length
+            core_floor = floor if core is None else floors.get(core)
+            if core_floor is not None and core_floor > job.originalPriority:
+                metrics.inversionTime += length
+
+    def mark(self) -> tuple[int, dict[int, JobMetrics]]:
+        """the number of job metrics and copies of those of pending jobs, the only ones still changing"""
+        return len(self.jobs), {index: copy.deepcopy(self.jobs[index]) for index in self.active.values()}
+
+    def rewind(self, mark: tuple[int, dict[int, JobMetrics]]) -> None:
+        """drop the job metrics added since mark and bring back those of the jobs then pending"""
+        length, pending = mark
+        self.jobs = self.jobs[:length]
+        for index, metrics in pending.items():
+            self.jobs[index] = copy.deepcopy(metrics)
+
+    def task_metrics(self) -> dict[int, TaskMetrics]:
+        jobs: dict[int, list[JobMetrics]] = {}
+        for metrics in self.jobs:
+            jobs.setdefault(metrics.taskId, []).append(metrics)
+        return {task_id: TaskMetrics(task_id, task_jobs, self.tick) for task_id, task_jobs in sorted(jobs.items())}
+
+    def job_rows(self) -> list[dict]:
+        return [metrics.to_dict(self.tick) for metrics in self.jobs]
+
+    def print_metrics(self) -> None:
+        print("\nMetrics:")
+        for task_metrics in self.task_metrics().values():
+            print(task_metrics)
+        print(f"context switches: {self.contextSwitches}")
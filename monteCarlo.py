@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+"""
+monteCarlo.py - response times and deadline miss probabilities under random execution times
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from taskSet import TaskSet
+from job import Job
+from semaphore import SemaphoreAP
+from simulator import Simulator, SchedulingPolicy
+from sensitivity import scaled_task_set
+
+PROTOCOLS = {
+    'SIMPLE': SemaphoreAP.SIMPLE,
+    'HLP': SemaphoreAP.HLP,
+    'PIP': SemaphoreAP.PIP,
+    'SRP': SemaphoreAP.SRP,
+}
+
+
+class DistributionType:
+    UNIFORM = 'uniform'  # between low and high
+    NORMAL = 'normal'  # normal of mean and std, truncated to [low, high]
+    EMPIRICAL = 'empirical'  # histogram of weights over the bins between edges, uniform within a bin
+
+
+class ExecutionTimeDistribution(object):
+    """A distribution of the execution time of the jobs of a task, as a fraction of its WCET.
+
+    Every section of a job is scaled by the same sampled fraction.
+    """
+
+    def __init__(self, kind: str, low: float = 0.0, high: float = 1.0, mean: float = None, std: float = None,
+                 edges: list[float] = None, weights: list[float] = None):
+        self.kind = kind
+        self.low = low
+        self.high = high
+        self.mean = mean if mean is not None else (low + high) / 2
+        self.std = std if std is not None else (high - low) / 4
+        self.edges = np.asarray(edges if edges is not None else [low, high], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [1.0] * (len(self.edges) - 1), dtype=np.float64)
+        if kind not in [DistributionType.UNIFORM, DistributionType.NORMAL, DistributionType.EMPIRICAL]:
+            raise ValueError(f"unknown distribution '{kind}'")
+        if kind == DistributionType.EMPIRICAL and len(self.weights) != len(self.edges) - 1:
+            raise ValueError("an empirical distribution needs one weight per bin, one less than its edges")
+
+    @staticmethod
+    def from_dict(spec: dict) -> ExecutionTimeDistribution:
+        """from {"type": ..., and the constructor's parameters}, as in a distributions JSON file"""
+        spec = dict(spec)
+        return ExecutionTimeDistribution(spec.pop('type'), **spec)
+
+    @staticmethod
+    def from_string(spec: str) -> ExecutionTimeDistribution:
+        """from 'uniform:LOW:HIGH' or 'normal:MEAN:STD[:LOW:HIGH]'"""
+        kind, *values = spec.split(':')
+        values = [float(value) for value in values]
+        if kind == DistributionType.UNIFORM and len(values) == 2:
+            return ExecutionTimeDistribution(kind, low=values[0], high=values[1])
+        if kind == DistributionType.NORMAL and len(values) in [2, 4]:
+            return ExecutionTimeDistribution(kind, *(values[2:] or [0.0, 1.0]), mean=values[0], std=values[1])
+        raise ValueError(f"expected uniform:LOW:HIGH or normal:MEAN:STD[:LOW:HIGH], got '{spec}'")
+
+    def sample(self, rng: np.random.Generator, count: int) -> np.ndarray:
+        if self.kind == DistributionType.UNIFORM:
+            return rng.uniform(self.low, self.high, count)
+        if self.kind == DistributionType.NORMAL:
+            samples = rng.normal(self.mean, self.std, count)
+            outside = np.flatnonzero((samples < self.low) | (samples > self.high))
+            while len(outside) > 0:  # rejection, redrawing only the samples outside the bounds
+                samples[outside] = rng.normal(self.mean, self.std, len(outside))
+                outside = outside[(samples[outside] < self.low) | (samples[outside] > self.high)]
+            return samples
+        bins = rng.choice(len(self.weights), count, p=self.weights / self.weights.sum())
+        return rng.uniform(self.edges[bins], self.edges[bins + 1])
+
+
+class SampledExecutionTimes(object):
+    """The sections of the jobs of one run, sampled up front, for Simulator's execution_times.
+
+    For each task with a distribution, the fractions of as many jobs as the schedule window can
+    hold are drawn at once and the section lengths scaled and rounded in NumPy, to whole ticks
+    and at least one. Jobs beyond that (sporadic tasks) draw twice as many again. Sections are
+    looked up by job id.
+    """
+
+    def __init__(self, task_set: TaskSet, distributions: dict[int, ExecutionTimeDistribution],
+                 rng: np.random.Generator):
+        self.rng = rng
+        self.distributions = distributions
+        self.resources: dict[int, tuple[int, ...]] = {}
+        self.lengths: dict[int, np.ndarray] = {}
+        self.jobSections: dict[int, list[tuple[tuple[int, int], ...]]] = {}
+        for task in task_set:
+            if task.id not in distributions:
+                continue
+            self.resources[task.id] = tuple(resource for resource, _ in task.sectionTable)
+            self.lengths[task.id] = np.array([length for _, length in task.sectionTable], dtype=np.float64)
+            self.jobSections[task.id] = []
+            count = 64
+            if task.period > 0:
+                count = math.ceil((task_set.endTime - max(task.offset, task_set.startTime)) / task.period) + 1
+            self.draw(task.id, max(count, 1))
+
+    def draw(self, task_id: int, count: int) -> None:
+        fractions = self.distributions[task_id].sample(self.rng, count)
+        lengths = self.lengths[task_id]
+        scaled = np.where(lengths > 0, np.maximum(1, np.rint(fractions[:, None] * lengths)), 0).astype(np.int64)
+        resources = self.resources[task_id]
+        self.jobSections[task_id].extend(tuple(zip(resources, row)) for row in scaled.tolist())
+
+    def sections(self, job: Job) -> tuple[tuple[int, int], ...] | None:
+        job_sections = self.jobSections.get(job.task.id)
+        if job_sections is None:
+            return None
+        while job.id > len(job_sections):
+            self.draw(job.task.id, len(job_sections))
+        return job_sections[job.id - 1]
+
+
+class MonteCarloResult(object):
+    """Outcome of many runs: per task, the response times of all completed jobs (in the task set's
+    units), the number of released jobs and of deadline misses; and how many runs missed a deadline."""
+
+    def __init__(self, runs: int = 0):
+        self.runs = runs
+        self.missRuns = 0
+        self.responseTimes: dict[int, np.ndarray] = {}
+        self.jobCounts: dict[int, int] = {}
+        self.missCounts: dict[int, int] = {}
+
+    def merge(self, other: MonteCarloResult) -> None:
+        self.runs += other.runs
+        self.missRuns += other.missRuns
+        for task_id, response_times in other.responseTimes.items():
+            self.responseTimes[task_id] = np.concatenate([self.responseTimes.get(task_id, np.zeros(0)),
+                                                          response_times])
+            self.jobCounts[task_id] = self.jobCounts.get(task_id, 0) + other.jobCounts[task_id]
+            self.missCounts[task_id] = self.missCounts.get(task_id, 0) + other.missCounts[task_id]
+
+    def miss_probability(self, task_id: int = None) -> float:
+        """the fraction of runs with a deadline miss, or of the jobs of task_id that missed"""
+        if task_id is None:
+            return self.missRuns / self.runs if self.runs > 0 else 0.0
+        jobs = self.jobCounts.get(task_id, 0)
+        return self.missCounts.get(task_id, 0) / jobs if jobs > 0 else 0.0
+
+    def histogram(self, task_id: int, bins: int = 20) -> tuple[np.ndarray, np.ndarray]:
+        """counts and bin edges of the response times of a task"""
+        return np.histogram(self.responseTimes.get(task_id, np.zeros(0)), bins=bins)
+
+    def print_summary(self) -> None:
+        print(f"runs: {self.runs}, runs with a deadline miss: {self.missRuns} ({self.miss_probability():.4f})")
+        for task_id in sorted(self.jobCounts.keys()):
+            response_times = self.responseTimes[task_id]
+            p50, p90, p99 = np.percentile(response_times, [50, 90, 99]) if len(response_times) > 0 else (0, 0, 0)
+            worst = response_times.max() if len(response_times) > 0 else 0
+            print(f"Task {task_id}: jobs={self.jobCounts[task_id]} "
+                  f"miss probability={self.miss_probability(task_id):.4f} "
+                  f"response p50={p50:g} p90={p90:g} p99={p99:g} max={worst:g}")
+
+
+def simulate_runs(data, access_protocol: SemaphoreAP, distributions: dict[int, ExecutionTimeDistribution],
+                  seed: int, runs: range, steps: int = 100,
+                  policy: SchedulingPolicy = SchedulingPolicy.DEADLINE_MONOTONIC) -> MonteCarloResult:
+    """some of the runs of a Monte Carlo simulation, run i sampled from the seed (seed, i)
+
+    The task set is parsed once, in ticks of 1/steps of its own tick so that scaled sections
+    stay close to their fraction.
+    """
+    task_set = scaled_task_set(data, 1.0, steps=steps)
+    response_times: dict[int, list[float]] = {task.id: [] for task in task_set}
+    result = MonteCarloResult(len(runs))
+    result.jobCounts = {task.id: 0 for task in task_set}
+    result.missCounts = {task.id: 0 for task in task_set}
+    for run in runs:
+        execution_times = SampledExecutionTimes(task_set, distributions, np.random.default_rng([seed, run]))
+        run_result = Simulator(task_set, access_protocol, record_trace=False, record_metrics=True, policy=policy,
+                               execution_times=execution_times).run()
+        if not run_result.feasible:
+            result.missRuns += 1
+        for metrics in run_result.metrics.jobs:
+            result.jobCounts[metrics.taskId] += 1
+            if metrics.missed:
+                result.missCounts[metrics.taskId] += 1
+            elif metrics.finish is not None:
+                response_times[metrics.taskId].append(metrics.get_response_time())
+    result.responseTimes = {task_id: np.array(times) * task_set.tick for task_id, times in response_times.items()}
+    return result
+
+
+def monte_carlo(data, access_protocol: SemaphoreAP, distributions: dict[int, ExecutionTimeDistribution],
+                runs: int = 1000, seed: int = 0, workers: int = 1, steps: int = 100,
+                policy: SchedulingPolicy = SchedulingPolicy.DEADLINE_MONOTONIC) -> MonteCarloResult:
+    """runs simulations of the task set (JSON data), in chunks over workers processes
+
+    Tasks without a distribution always take their WCET. Run i is seeded with (seed, i), so the
+    result does not depend on the number of workers.
+    """
+    chunk_size = max(1, math.ceil(runs / (workers * 4)))
+    chunks = [range(start, min(start + chunk_size, runs)) for start in range(0, runs, chunk_size)]
+    result = MonteCarloResult()
+    if workers <= 1:
+        for chunk in chunks:
+            result.merge(simulate_runs(data, access_protocol, distributions, seed, chunk, steps, policy))
+        return result
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(simulate_runs, data, access_protocol, distributions, seed, chunk, steps, policy)
+                   for chunk in chunks]
+        for future in futures:
+            result.merge(future.result())
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('task_set', help='task set JSON file')
+    parser.add_argument('-p', '--protocol', choices=list(PROTOCOLS.keys()), default='PIP')
+    parser.add_argument('--edf', action='store_true',
+                        help='schedule by earliest deadline instead of deadline monotonic')
+    parser.add_argument('-n', '--runs', type=int, default=1000)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('-d', '--distribution', default='uniform:0.5:1',
+                        help="fraction of the WCET of every task: 'uniform:LOW:HIGH' or 'normal:MEAN:STD[:LOW:HIGH]'")
+    parser.add_argument('--distributions', default=None,
+                        help='JSON file mapping task ids to distributions, '
+                             'e.g. {"1": {"type": "empirical", "edges": [0.2, 0.5, 1], "weights": [3, 1]}}')
+    parser.add_argument('--histogram', default=None, help='write the response time histograms as CSV to this path')
+    parser.add_argument('--bins', type=int, default=20)
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of processes (default: all cores)')
+    args = parser.parse_args()
+    if args.edf and args.protocol == 'HLP':
+        parser.error("HLP needs fixed priorities, use SRP with --edf")
+
+    with open(args.task_set) as json_data:
+        data = json.load(json_data)
+
+    default = ExecutionTimeDistribution.from_string(args.distribution)
+    distributions = {task.id: default for task in TaskSet(data, build_jobs=False)}
+    if args.distributions is not None:
+        with open(args.distributions) as json_data:
+            for task_id, spec in json.load(json_data).items():
+                distributions[int(task_id)] = ExecutionTimeDistribution.from_dict(spec)
+
+    policy = SchedulingPolicy.EDF if args.edf else SchedulingPolicy.DEADLINE_MONOTONIC
+    result = monte_carlo(data, PROTOCOLS[args.protocol], distributions, args.runs, args.seed,
+                         args.workers or os.cpu_count() or 1, policy=policy)
+    result.print_summary()
+
+    if args.histogram is not None:
+        with open(args.histogram, 'w') as output:
+            output.write('Task,Start,End,Count\n')
+            for task_id in sorted(result.responseTimes.keys()):
+                counts, edges = result.histogram(task_id, args.bins)
+                for count, start, end in zip(counts.tolist(), edges[:-1].tolist(), edges[1:].tolist()):
+                    output.write(f'{task_id},{start:g},{end:g},{count}\n')
+
+
+if __name__ == "__main__":
+    main()
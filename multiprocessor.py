@@ -0,0 +1,158 @@
+import math
+
+from job import Job, JobState
+from jobQueue import JobQueue
+from taskSet import TaskSet
+from semaphore import SemaphoreSet, SemaphoreAP
+from simulator import Simulator, SimulationResult, MissCheck
+
+
+class SchedulingMode:
+    PARTITIONED = 0  # Every task is bound to one processor, each processor has its own ready queue
+    GLOBAL = 1  # One ready queue, the highest priority ready jobs run on the processors
+
+
+class PackingHeuristic:
+    FIRST_FIT = 0
+    WORST_FIT = 1
+
+
+def partition_tasks(task_set: TaskSet, processors: int,
+                    heuristic: PackingHeuristic = PackingHeuristic.FIRST_FIT) -> dict[int, int]:
+    """assign tasks to processors by decreasing utilization, raises ValueError if one does not fit
+
+    First-fit puts a task on the first processor it fits on, worst-fit on the least loaded one.
+    """
+    loads = [0.0] * processors
+    assignment: dict[int, int] = {}
+    for task in sorted(task_set, key=lambda task: max(task.get_utilization(), 0), reverse=True):
+        utilization = max(task.get_utilization(), 0)
+        if heuristic == PackingHeuristic.WORST_FIT:
+            candidates = [min(range(processors), key=lambda core: loads[core])]
+        else:
+            candidates = range(processors)
+        for core in candidates:
+            if loads[core] + utilization <= 1:
+                loads[core] += utilization
+                assignment[task.id] = core
+                break
+        else:
+            raise ValueError(f"task {task.id} does not fit on {processors} processors")
+    return assignment
+
+
+class MultiprocessorSimulator(Simulator):
+    """Scheduler of a TaskSet on identical processors, partitioned or global.
+
+    Time advances in steps that end at the next event or the next section boundary of a running
+    job, so all processors move together. Resources shared between processors (all of them
+    under global scheduling) are global and follow MPCP or MSRP; time spent spinning on a global
+    resource is traced with the negated resource id. Cycle detection is not supported.
+    """
+
+    def __init__(self, task_set: TaskSet, processors: int = 2, mode: SchedulingMode = SchedulingMode.PARTITIONED,
+                 access_protocol: SemaphoreAP = SemaphoreAP.MPCP,
+                 heuristic: PackingHeuristic = PackingHeuristic.FIRST_FIT, assignment: dict[int, int] = None,
+                 record_trace: bool = True, record_metrics: bool = False, trace_path: str = None,
+                 stop_at_miss: MissCheck = MissCheck.NONE, checkpoint_interval: float = None, execution_times=None):
+        super().__init__(task_set, access_protocol, record_trace=False, record_metrics=record_metrics,
+                         stop_at_miss=stop_at_miss, checkpoint_interval=checkpoint_interval,
+                         execution_times=execution_times)
+        self.processors = processors
+        self.mode = mode
+        self.trace = self.make_trace(processors, record_trace, trace_path)
+        self.assignment: dict[int, int] = {}
+        self.readyQueues: list[JobQueue] = []
+        self.coreOf: dict[Job, int] = {}
+
+        global_resources = set(task_set.get_all_resources())
+        if mode == SchedulingMode.PARTITIONED:
+            self.assignment = assignment if assignment is not None else partition_tasks(task_set, processors,
+                                                                                        heuristic)
+            self.readyQueues = [JobQueue() for _ in range(processors)]
+            global_resources = set()
+            for resource in task_set.get_all_resources():
+                cores = {self.assignment[task.id] for task in task_set if resource in task.get_all_resources()}
+                if len(cores) > 1:
+                    global_resources.add(resource)
+        self.semaphores = SemaphoreSet(task_set.get_all_resources(), task_set.get_lowest_priority(), access_protocol,
+                                       task_set.get_highest_priorities(), global_resources)
+
+    def ready_queue_for(self, job: Job) -> JobQueue:
+        if self.mode == SchedulingMode.PARTITIONED:
+            return self.readyQueues[self.assignment[job.task.id]]
+        return self.readyQueue
+
+    def pending_jobs(self):
+        queues = self.readyQueues if self.mode == SchedulingMode.PARTITIONED else [self.readyQueue]
+        for queue in queues + [self.waitingQueue]:
+            for job in queue:
+                yield self.assignment.get(job.task.id), job
+
+    def select_jobs(self) -> list[tuple[int, Job]]:
+        """the (processor, job) pairs that run next"""
+        if self.mode == SchedulingMode.PARTITIONED:
+            return [(core, queue.peek()) for core, queue in enumerate(self.readyQueues) if len(queue) > 0]
+
+        jobs = self.readyQueue.smallest(self.processors)
+        # keep running jobs on their processor, hand the free ones to the others
+        free = sorted(set(range(self.processors)) - {self.coreOf[job] for job in jobs if job in self.coreOf})
+        running = []
+        for job in jobs:
+            core = self.coreOf.get(job)
+            if core is None:
+                core = free.pop(0)
+            running.append((core, job))
+        self.coreOf = {job: core for core, job in running}
+        return running
+
+    def execute_until(self, time: float) -> None:
+        while self.currTime < time:
+            running = self.select_jobs()
+            # a job that suspends on a resource leaves its processor to the next one in line
+            while not all(job.acquire() or job.state == JobState.READY for _, job in running):
+                running = self.select_jobs()
+            if len(running) == 0:
+                if self.metrics is not None:
+                    self.metrics.on_interval(self.currTime, time - self.currTime, [], self.pending_jobs())
+                self.currTime = time
+                continue
+
+            # decided up front: a lock handed over during this step only counts from the next one
+            holds = [job.gotLock for _, job in running]
+            step = time - self.currTime
+            for (_, job), holding in zip(running, holds):
+                if holding:
+                    step = min(step, job.sectionRemaining)
+            for (core, job), holding in zip(running, holds):
+                if holding:
+                    progression, resource = job.execute(step)
+                    self.record(job, self.currTime, progression, resource, core)
+                elif self.trace is not None:
+                    resource = job.sections[job.currSectionIdx][0]
+                    self.trace.add(self.currTime, self.currTime + step, job.task.id, job.id, -resource, core)
+            if self.metrics is not None:
+                self.metrics.on_interval(self.currTime, step, [pair for pair, holding in zip(running, holds) if holding],
+                                         self.pending_jobs())
+            self.currTime += step
+
+
+def required_processors(data, access_protocol: SemaphoreAP = SemaphoreAP.MPCP,
+                        mode: SchedulingMode = SchedulingMode.PARTITIONED,
+                        heuristic: PackingHeuristic = PackingHeuristic.FIRST_FIT,
+                        max_processors: int = None) -> int | None:
+    """the fewest processors, starting from the total utilization, on which the task set (JSON data) misses no deadline"""
+    task_set = TaskSet(data, build_jobs=False)
+    utilization = sum(max(task.get_utilization(), 0) for task in task_set)
+    if max_processors is None:
+        max_processors = max(len(task_set), 1)
+    for processors in range(max(1, math.ceil(utilization)), max_processors + 1):
+        try:
+            simulator = MultiprocessorSimulator(task_set, processors, mode, access_protocol,
+                                                heuristic, record_trace=False, stop_at_miss=MissCheck.DEADLINE)
+        except ValueError:
+            continue
+        result: SimulationResult = simulator.run()
+        if result.feasible:
+            return processors
+    return None
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+"""
+releaseLog.py - sporadic release times streamed from NDJSON, CSV or binary release logs
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import struct
+from fractions import Fraction
+
+from task import TaskSetJsonKeys as TSJK
+
+
+class ReleaseFormat:
+    NDJSON = 0  # one {"timeInstant": ..., "taskId": ...} object per line
+    CSV = 1  # time,task rows, with an optional header line
+    BINARY = 2  # a HEADER, then fixed-width RECORD rows
+
+
+EXTENSIONS = {
+    '.ndjson': ReleaseFormat.NDJSON,
+    '.jsonl': ReleaseFormat.NDJSON,
+    '.csv': ReleaseFormat.CSV,
+    '.bin': ReleaseFormat.BINARY,
+    '.rel': ReleaseFormat.BINARY,
+}
+
+MAGIC = b'RELEASES'
+HEADER = struct.Struct('<8sII')  # magic, version, reserved
+VERSION = 1
+RECORD = struct.Struct('<dq')  # time, task
+RECORD_FIELDS = [('time', '<f8'), ('task', '<i8')]
+
+
+def release_format(path: str) -> int:
+    """the ReleaseFormat of a path, from its extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXTENSIONS:
+        raise ValueError(f"unknown release log extension '{extension}', expected one of {', '.join(EXTENSIONS)}")
+    return EXTENSIONS[extension]
+
+
+def write_releases(releases, path: str, fmt: int = None) -> int:
+    """write (time, task_id) pairs as a release log, returns the number of rows"""
+    if fmt is None:
+        fmt = release_format(path)
+    rows = 0
+    with open(path, 'wb') as output:
+        if fmt == ReleaseFormat.BINARY:
+            output.write(HEADER.pack(MAGIC, VERSION, 0))
+        elif fmt == ReleaseFormat.CSV:
+            output.write(b'time,task\n')
+        for release_time, task_id in releases:
+            if fmt == ReleaseFormat.BINARY:
+                output.write(RECORD.pack(release_time, task_id))
+            elif fmt == ReleaseFormat.CSV:
+                output.write(f'{release_time!r},{task_id}\n'.encode())
+            else:
+                output.write(json.dumps({TSJK.KEY_RELEASETIMES_JOBRELEASE: release_time,
+                                         TSJK.KEY_RELEASETIMES_TASKID: task_id}).encode() + b'\n')
+            rows += 1
+    return rows
+
+
+class ReleaseLog(object):
+    """The release times of a sporadic task set, kept in a file and read chunk by chunk.
+
+    Pass it as TaskSet(data, releases=...) in place of the releaseTimes of the JSON document.
+    Iterating it yields (time, task_id) like TaskSet.releaseTimes, reading chunk_rows rows at a
+    time, so the lazy EventSource never holds more than one chunk. The log must be sorted by time.
+    Each chunk is validated with NumPy before any of it is yielded: the order, and that releases
+    of a task are separated by its period, as Task.is_valid_release checks them one at a time.
+    Invalid releases are dropped with one message per chunk.
+    """
+
+    def __init__(self, path: str, fmt: int = None, chunk_rows: int = 65536):
+        self.path = path
+        self.format = release_format(path) if fmt is None else fmt
+        self.chunkRows = chunk_rows
+        self.periods: dict[int, float] = {}
+        self.startTime = 0.0
+        self.tick: Fraction | None = None
+        if self.format == ReleaseFormat.BINARY:
+            with open(path, 'rb') as log_file:
+                magic, version, _ = HEADER.unpack(log_file.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} release log")
+
+    def configure(self, periods: dict[int, float], start_time: float, tick: Fraction | None) -> None:
+        """the task periods, start time and tick of the task set the releases belong to"""
+        self.periods = periods
+        self.startTime = start_time
+        self.tick = tick
+
+    def read_chunk(self, offset: int) -> tuple[object, object, int]:
+        """up to chunk_rows raw times and task ids from a byte offset, and the offset of the next chunk"""
+        import numpy as np
+
+        with open(self.path, 'rb') as log_file:
+            if self.format == ReleaseFormat.BINARY:
+                offset = max(offset, HEADER.size)
+                log_file.seek(offset)
+                records = np.fromfile(log_file, dtype=np.dtype(RECORD_FIELDS), count=self.chunkRows)
+                return records['time'], records['task'], offset + len(records) * RECORD.size
+
+            log_file.seek(offset)
+            lines = []
+            while len(lines) < self.chunkRows:
+                line = log_file.readline()
+                if len(line) == 0:
+                    break
+                if len(line.strip()) > 0:
+                    lines.append(line)
+            next_offset = log_file.tell()
+
+        if self.format == ReleaseFormat.CSV:
+            if offset == 0 and len(lines) > 0 and not lines[0].lstrip()[:1] in b'+-.0123456789':
+                lines = lines[1:]  # header
+            rows = np.array([line.split(b',')[:2] for line in lines], dtype=np.float64).reshape(-1, 2)
+            return rows[:, 0], rows[:, 1].astype(np.int64), next_offset
+        releases = [json.loads(line) for line in lines]
+        times = np.array([release[TSJK.KEY_RELEASETIMES_JOBRELEASE] for release in releases], dtype=np.float64)
+        tasks = np.array([release[TSJK.KEY_RELEASETIMES_TASKID] for release in releases], dtype=np.int64)
+        return times, tasks, next_offset
+
+    def to_ticks(self, times):
+        """raw times as int64 ticks, unchanged for float times; ValueError if one is not a multiple of the tick"""
+        import numpy as np
+
+        if self.tick is None:
+            return times
+        ticks = np.rint(times / float(self.tick))
+        inexact = np.abs(ticks * float(self.tick) - times) > 1e-9 * np.maximum(1.0, np.abs(times))
+        if inexact.any():
+            raise ValueError(f"time {times[np.argmax(inexact)]} is not a multiple of the tick {float(self.tick)}")
+        return ticks.astype(np.int64)
+
+    def check_tick(self) -> None:
+        """stream through the raw times once, raising ValueError at the first that is not a multiple of the tick"""
+        offset = 0
+        while True:
+            times, _, next_offset = self.read_chunk(offset)
+            if len(times) > 0:
+                self.to_ticks(times)
+            if next_offset == offset:
+                return
+            offset = next_offset
+
+    def __iter__(self) -> ReleaseLogIterator:
+        return ReleaseLogIterator(self)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ReleaseLog) and (self.path, self.format) == (other.path, other.format)
+
+    __hash__ = None
+
+    def validate(self) -> int:
+        """stream through the whole log, returns the number of valid releases"""
+        return sum(1 for _ in self)
+
+
+class ReleaseLogIterator(object):
+    """The position in a ReleaseLog: the next byte offset, the current chunk and the last valid
+    release of each task. It holds no open file, so simulator checkpoints can copy it."""
+
+    def __init__(self, log: ReleaseLog):
+        self.log = log
+        self.offset = 0
+        self.chunk: list[tuple[float, int]] = []
+        self.index = 0
+        self.lastTime = float('-inf')
+        self.lastReleases: dict[int, float] = {}
+        self.done = False
+
+    def __iter__(self) -> ReleaseLogIterator:
+        return self
+
+    def __next__(self) -> tuple[float, int]:
+        while self.index >= len(self.chunk):
+            if self.done:
+                raise StopIteration
+            self.next_chunk()
+        release = self.chunk[self.index]
+        self.index += 1
+        return release
+
+    def next_chunk(self) -> None:
+        times, tasks, offset = self.log.read_chunk(self.offset)
+        self.chunk = []
+        self.index = 0
+        self.done = offset == self.offset
+        self.offset = offset
+        if len(times) == 0:
+            return
+        times = self.log.to_ticks(times)
+        self.chunk = self.validate(times, tasks)
+
+    def validate(self, times, tasks) -> list[tuple[float, int]]:
+        """the valid releases of a chunk, in order"""
+        import numpy as np
+
+        unsorted = np.flatnonzero(np.diff(times) < 0)
+        if times[0] < self.lastTime or len(unsorted) > 0:
+            row = times[unsorted[0] + 1] if times[0] >= self.lastTime else times[0]
+            raise ValueError(f"{self.log.path} is not sorted by time, at release time {row}")
+        self.lastTime = times[-1]
+
+        keep = times >= self.log.startTime
+        known = np.isin(tasks, np.fromiter(self.log.periods.keys(), dtype=np.int64, count=len(self.log.periods)))
+        if not known[keep].all():
+            print(f"INVALID: {np.count_nonzero(keep & ~known)} releases of unknown tasks")
+        keep &= known
+        times, tasks = times[keep], tasks[keep]
+        if len(times) == 0:
+            return []
+
+        # each release against the previous one of its task, with the tasks grouped by a stable sort
+        order = np.argsort(tasks, kind='stable')
+        task_ids, first, inverse = np.unique(tasks[order], return_index=True, return_inverse=True)
+        sorted_times = times[order]
+        previous = np.empty_like(sorted_times, dtype=np.float64)
+        previous[1:] = sorted_times[:-1]
+        previous[first] = [self.lastReleases.get(task_id, 0.0) for task_id in task_ids.tolist()]
+        periods = np.array([self.log.periods[task_id] for task_id in task_ids.tolist()], dtype=np.float64)[inverse]
+        valid = ~((previous > 0) & (sorted_times < previous + periods))
+
+        if not valid.all():
+            # a dropped release does not count as the last one, so recheck those tasks one release at a time
+            for group in np.unique(inverse[~valid]).tolist():
+                rows = np.flatnonzero(inverse == group)
+                last = self.lastReleases.get(task_ids[group].item(), 0.0)
+                period = self.log.periods[task_ids[group].item()]
+                for row, release_time in zip(rows.tolist(), sorted_times[rows].tolist()):
+                    valid[row] = not (last > 0 and release_time < last + period)
+                    if valid[row]:
+                        last = release_time
+            print(f"INVALID: {np.count_nonzero(~valid)} releases are not separated by the period of their task")
+
+        last_rows = np.append(first[1:], len(order)) - 1
+        for group, task_id in enumerate(task_ids.tolist()):
+            rows = np.flatnonzero(valid[first[group]:last_rows[group] + 1])
+            if len(rows) > 0:
+                self.lastReleases[task_id] = sorted_times[first[group] + rows[-1]].item()
+
+        mask = np.empty_like(valid)
+        mask[order] = valid
+        return list(zip(times[mask].tolist(), tasks[mask].tolist()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('task_set', help='task set JSON file whose releaseTimes are converted')
+    parser.add_argument('output', help='release log to write, .ndjson/.jsonl, .csv or .bin/.rel')
+    args = parser.parse_args()
+
+    with open(args.task_set) as json_data:
+        data = json.load(json_data)
+    releases = sorted(((float(release[TSJK.KEY_RELEASETIMES_JOBRELEASE]), int(release[TSJK.KEY_RELEASETIMES_TASKID]))
+                       for release in data.get(TSJK.KEY_RELEASETIMES, [])), key=lambda release: release[0])
+    print(f"{write_releases(releases, args.output)} releases written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
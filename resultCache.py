@@ -0,0 +1,183 @@
+"""
+resultCache.py - simulation results cached on disk by a hash of the task set and the simulator options
+"""
+
+from __future__ import annotations
+import hashlib
+import os
+import pickle
+import shutil
+from collections import OrderedDict
+
+from taskSet import TaskSet
+from semaphore import SemaphoreAP
+from simulator import Simulator, SimulationResult, MissCheck, SchedulingPolicy
+from metrics import MetricsRecorder
+from releaseLog import ReleaseLog
+
+DEFAULT_DIRECTORY = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'taskset-results')
+VERSION = 1  # part of every key, bumped when the simulator's results change
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as data:
+        for block in iter(lambda: data.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def task_set_key(task_set: TaskSet, access_protocol: SemaphoreAP, **options) -> str:
+    """a hash of everything the simulation of task_set depends on
+
+    That is the parsed tasks and sections, the schedule window, the tick and the release times
+    (the content of a release log), plus the access protocol and the simulator options.
+    """
+    tasks = tuple((task.id, task.period, task.wcet, task.relativeDeadline, task.offset, task.sectionTable)
+                  for task in sorted(task_set, key=lambda task: task.id))
+    releases = task_set.releaseTimes
+    if isinstance(releases, ReleaseLog):
+        releases = (releases.format, file_digest(releases.path))
+    elif releases is not None:
+        releases = tuple(releases)
+    canonical = (VERSION, tasks, task_set.startTime, task_set.endTime, task_set.tick, releases, access_protocol,
+                 tuple(sorted(options.items())))
+    return hashlib.sha256(repr(canonical).encode()).hexdigest()
+
+
+class CachedResult(object):
+    """The compact part of a SimulationResult that the cache keeps.
+
+    deadlineMisses are (task id, job id, deadline) tuples instead of jobs, metrics is a
+    MetricsRecorder holding the metrics of every released job and the context switch count,
+    but none of the simulation's jobs, and tracePath is the cached copy of the trace file of a
+    simulation run with a trace_path, None otherwise. The in-memory trace is not kept.
+    """
+
+    def __init__(self, result: SimulationResult, tick: float = 1, trace_path: str = None):
+        self.feasible = result.feasible
+        self.missCount = result.missCount
+        self.endTime = result.endTime
+        self.firstMissTime = result.firstMissTime
+        self.deadlineMisses = [(job.task.id, job.id, job.get_deadline() * tick) for job in result.deadlineMisses]
+        self.maxResponseTimes = result.maxResponseTimes
+        self.executedTime = result.executedTime
+        self.cycle = result.cycle
+        self.metrics = None
+        if result.metrics is not None:
+            self.metrics = MetricsRecorder(result.metrics.tick)
+            self.metrics.jobs = result.metrics.jobs
+            self.metrics.contextSwitches = result.metrics.contextSwitches
+        self.tracePath = trace_path
+
+
+class ResultCache(object):
+    """Simulation results on disk under directory, one pickle per key, plus an in-process memo.
+
+    Hits are served from the memo, the memo_entries most recently used results, then from disk.
+    Reading an entry touches its file, and once the files exceed max_bytes the least recently
+    used are evicted. Entries are written to a temporary file and renamed, so processes can
+    share a directory.
+    """
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, max_bytes: int = 256 << 20, memo_entries: int = 1024):
+        self.directory = directory
+        self.maxBytes = max_bytes
+        self.memoEntries = memo_entries
+        self.memo: OrderedDict[str, CachedResult] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def path(self, key: str, extension: str = '.pkl') -> str:
+        return os.path.join(self.directory, key + extension)
+
+    def remember(self, key: str, result: CachedResult) -> None:
+        self.memo[key] = result
+        self.memo.move_to_end(key)
+        while len(self.memo) > self.memoEntries:
+            self.memo.popitem(last=False)
+
+    def get(self, key: str) -> CachedResult | None:
+        result = self.memo.get(key)
+        if result is not None:
+            self.memo.move_to_end(key)
+            self.hits += 1
+            return result
+        try:
+            with open(self.path(key), 'rb') as entry:
+                result = pickle.load(entry)
+            os.utime(self.path(key))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        if result.tracePath is not None and not os.path.exists(result.tracePath):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.remember(key, result)
+        return result
+
+    def put(self, key: str, result: CachedResult) -> None:
+        if result.tracePath is not None and result.tracePath != self.path(key, '.trace'):
+            if os.path.exists(self.path(key, '.trace')):
+                self.size -= os.path.getsize(self.path(key, '.trace'))
+            shutil.copyfile(result.tracePath, self.path(key, '.trace'))
+            self.size += os.path.getsize(self.path(key, '.trace'))
+            result.tracePath = self.path(key, '.trace')
+        if os.path.exists(self.path(key)):
+            self.size -= os.path.getsize(self.path(key))
+        temporary = self.path(key, f'.{os.getpid()}.tmp')
+        with open(temporary, 'wb') as entry:
+            pickle.dump(result, entry, protocol=pickle.HIGHEST_PROTOCOL)
+        self.size += os.path.getsize(temporary)
+        os.replace(temporary, self.path(key))
+        self.remember(key, result)
+        if self.size > self.maxBytes:
+            self.evict()
+
+    def evict(self) -> None:
+        """remove the least recently used entries until the directory fits in max_bytes"""
+        entries = sorted((entry.stat().st_mtime, entry.path) for entry in os.scandir(self.directory)
+                         if entry.is_file() and entry.name.endswith('.pkl'))
+        self.size = sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+        for _, path in entries:
+            if self.size <= self.maxBytes:
+                break
+            key = os.path.basename(path)[:-len('.pkl')]
+            for entry_path in [path, self.path(key, '.trace')]:
+                try:
+                    self.size -= os.path.getsize(entry_path)
+                    os.remove(entry_path)
+                except OSError:
+                    pass
+            self.memo.pop(key, None)
+
+    def clear(self) -> None:
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                os.remove(entry.path)
+        self.memo.clear()
+        self.size = 0
+
+    def simulate(self, task_set: TaskSet, access_protocol: SemaphoreAP = SemaphoreAP.SIMPLE,
+                 detect_cycle: bool = False, record_metrics: bool = False, trace_path: str = None,
+                 stop_at_miss: MissCheck = MissCheck.NONE,
+                 policy: SchedulingPolicy = SchedulingPolicy.DEADLINE_MONOTONIC) -> CachedResult:
+        """the cached result of simulating task_set, simulated and stored on a miss
+
+        With trace_path the trace is streamed there and a copy is kept in the cache; a hit
+        returns the cached copy's path as tracePath.
+        """
+        key = task_set_key(task_set, access_protocol, detect_cycle=detect_cycle, record_metrics=record_metrics,
+                           trace=trace_path is not None, stop_at_miss=stop_at_miss, policy=policy)
+        result = self.get(key)
+        if result is not None:
+            return result
+        simulator = Simulator(task_set, access_protocol, record_trace=trace_path is not None,
+                              detect_cycle=detect_cycle, record_metrics=record_metrics, trace_path=trace_path,
+                              stop_at_miss=stop_at_miss, policy=policy)
+        result = CachedResult(simulator.run(), task_set.tick, trace_path)
+        self.put(key, result)
+        return result
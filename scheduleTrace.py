@@ -0,0 +1,92 @@
+from __future__ import annotations
+from array import array
+
+
+class ScheduleTrace(object):
+    """Append-only execution trace stored as typed columns.
+
+    Each column is an array.array, which over-allocates geometrically, so appending a
+    segment is amortized O(1). A segment that continues the last one of its core (same job
+    and resource, starting where it ended) is merged into it in place. The Core column is
+    only part of the DataFrame of multiprocessor traces. Times are kept in the simulation's
+    time base and multiplied by tick when converted.
+    """
+
+    def __init__(self, cores: int = 1, tick: float = 1):
+        self.coreCount = cores
+        self.tick = tick
+        self.starts = array('d')
+        self.ends = array('d')
+        self.tasks = array('q')
+        self.jobs = array('q')
+        self.resources = array('q')
+        self.cores = array('q')
+        self.lastRows: dict[int, int] = {}
+        self.frame = None
+
+    def add(self, start: float, end: float, task_id: int, job_id: int, resource: int, core: int = 0) -> None:
+        self.frame = None
+        row = self.lastRows.get(core)
+        if row is not None and self.ends[row] == start and self.jobs[row] == job_id and \
+                self.tasks[row] == task_id and self.resources[row] == resource:
+            self.ends[row] = end
+            return
+        self.lastRows[core] = len(self.starts)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.tasks.append(task_id)
+        self.jobs.append(job_id)
+        self.resources.append(resource)
+        self.cores.append(core)
+
+    def mark(self) -> tuple:
+        """the current length of the trace, for rewind and prefix"""
+        return len(self.starts), {core: (row, self.ends[row]) for core, row in self.lastRows.items()}
+
+    def rewind(self, mark: tuple) -> None:
+        """drop what was added since mark, including extensions of the rows it ended with"""
+        self.frame = None
+        length, last_rows = mark
+        for column in [self.starts, self.ends, self.tasks, self.jobs, self.resources, self.cores]:
+            del column[length:]
+        self.lastRows = {}
+        for core, (row, end) in last_rows.items():
+            self.ends[row] = end
+            self.lastRows[core] = row
+
+    def prefix(self, mark: tuple) -> ScheduleTrace:
+        """a new trace holding what this one held at mark"""
+        length = mark[0]
+        trace = ScheduleTrace(self.coreCount, self.tick)
+        trace.starts = self.starts[:length]
+        trace.ends = self.ends[:length]
+        trace.tasks = self.tasks[:length]
+        trace.jobs = self.jobs[:length]
+        trace.resources = self.resources[:length]
+        trace.cores = self.cores[:length]
+        trace.rewind(mark)
+        return trace
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends, self.tasks, self.jobs, self.resources, self.cores)
+
+    def to_dataframe(self):
+        """the trace as a pandas DataFrame, built once and cached until the next add"""
+        if self.frame is not None:
+            return self.frame
+        import pandas as pd
+
+        columns = {
+            'Start': [start * self.tick for start in self.starts] if self.tick != 1 else self.starts.tolist(),
+            'End': [end * self.tick for end in self.ends] if self.tick != 1 else self.ends.tolist(),
+            'Task': self.tasks.tolist(),
+            'Job': self.jobs.tolist(),
+            'Resource': [str(resource) for resource in self.resources],
+        }
+        if self.coreCount > 1:
+            columns['Core'] = self.cores.tolist()
+        self.frame = pd.DataFrame(columns, columns=list(columns.keys()))
+        return self.frame
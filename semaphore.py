@@ -1,50 +1,152 @@
+from jobQueue import JobQueue
+
+
 class SemaphoreAP:
     SIMPLE = 0
     HLP = 1
     PIP = 2
+    MPCP = 3  # Multiprocessor: suspend on global resources, run global sections above every normal priority
+    MSRP = 4  # Multiprocessor: spin in FIFO order on global resources, run global sections non-preemptively
+    SRP = 5  # Stack Resource Policy: a job only starts once its preemption level is above the system ceiling
 
 
 class SemaphoreSet(object):
+    """The semaphores of a task set under one access protocol.
+
+    Under MPCP and MSRP, global_resources are the ones shared between processors; the others are
+    local and handled with PIP (MPCP) or HLP (MSRP, standing in for SRP).
+
+    Under SRP, the preemption level of a job is its task's relative deadline and the ceiling of a
+    resource the shortest relative deadline among its users, both lower for higher. The ceilings of
+    the taken resources form a stack whose top is the system ceiling. A job that has not started
+    is admitted only below it and otherwise deferred until a signal lowers it, so a job blocks at
+    most once, before it starts, and never on a semaphore. This works under fixed priorities and
+    EDF alike.
+    """
+
     def __init__(self, resources: list[int], lowest_priority=1000, access_protocol: SemaphoreAP = SemaphoreAP.SIMPLE,
-                 resources_highest_priority: dict[int, float] = {}):
+                 resources_highest_priority: dict[int, float] = {}, global_resources: set[int] = None):
         self.semaphores = {}
         self.lowestPriority = lowest_priority
         self.accessProtocol = access_protocol
+        self.localProtocol = access_protocol
+        self.globalResources: set[int] = set()
+        self.ceilings: list[float] = []  # SRP system ceiling stack
+        self.deferred: list = []  # SRP jobs waiting for the system ceiling to drop
+        if access_protocol in [SemaphoreAP.MPCP, SemaphoreAP.MSRP]:
+            self.localProtocol = SemaphoreAP.PIP if access_protocol == SemaphoreAP.MPCP else SemaphoreAP.HLP
+            self.globalResources = set(global_resources) if global_resources is not None else set(resources)
         self.resourcesHighestPriority = resources_highest_priority.copy()
         for resource in resources:
             self.semaphores[resource] = Semaphore(resource, lowest_priority)
-            if self.accessProtocol in [SemaphoreAP.HLP] and \
+            if self.accessProtocol in [SemaphoreAP.HLP, SemaphoreAP.MPCP, SemaphoreAP.MSRP, SemaphoreAP.SRP] and \
                     (resource not in self.resourcesHighestPriority or self.resourcesHighestPriority[resource] == -1):
                 self.resourcesHighestPriority[resource] = self.lowestPriority
 
+    def spins(self, resource) -> bool:
+        """whether a job waiting for resource keeps its processor busy instead of suspending"""
+        return self.accessProtocol == SemaphoreAP.MSRP and resource in self.globalResources
+
+    def global_priority(self, resource) -> float:
+        """the priority of a global section, above every normal priority (MSRP: non-preemptive)"""
+        if self.accessProtocol == SemaphoreAP.MSRP:
+            return -self.lowestPriority
+        return self.resourcesHighestPriority[resource] - self.lowestPriority
+
+    def admit(self, job) -> bool:
+        """whether a job that has not started yet may start, if not it is deferred (SRP)"""
+        if self.accessProtocol != SemaphoreAP.SRP or len(self.ceilings) == 0 or \
+                job.task.get_priority() < self.ceilings[-1]:
+            return True
+        self.deferred.append(job)
+        return False
+
+    def lower_ceiling(self, resource) -> None:
+        """pop the ceiling of a freed resource and wake the deferred jobs now above the system ceiling"""
+        ceiling = self.resourcesHighestPriority[resource]
+        for idx in range(len(self.ceilings) - 1, -1, -1):
+            if self.ceilings[idx] == ceiling:
+                del self.ceilings[idx]
+                break
+        system_ceiling = self.ceilings[-1] if len(self.ceilings) > 0 else float('inf')
+        deferred = []
+        for job in self.deferred:
+            if job not in job.waitingQueue:
+                continue  # aborted while deferred
+            if job.task.get_priority() < system_ceiling:
+                job.wake()
+            else:
+                deferred.append(job)
+        self.deferred = deferred
+
     def wait(self, resource, job) -> int:
         if resource == 0:
             return 0
+        if self.accessProtocol == SemaphoreAP.SRP and resource in self.semaphores.keys():
+            res = self.semaphores[resource].wait(job)
+            if res == 0:
+                self.ceilings.append(self.resourcesHighestPriority[resource])
+            return res
+        if resource in self.globalResources:
+            if self.accessProtocol == SemaphoreAP.MSRP:
+                # raised before queuing, so that spinning jobs share one priority and are served FIFO
+                job.elevate_priority(self.global_priority(resource))
+            res = self.semaphores[resource].wait(job)
+            if res == 0:
+                job.elevate_priority(self.global_priority(resource))
+            return res
         if resource in self.semaphores.keys():
             res = self.semaphores[resource].wait(job)
             # if res == -1:
             #     print(f"Resource {resource} is taken by {self.semaphores[resource].owner.short_form()}")
-            if self.accessProtocol == SemaphoreAP.HLP:
+            if self.localProtocol == SemaphoreAP.HLP:
                 job.elevate_priority(self.resourcesHighestPriority[resource])
-            elif self.accessProtocol == SemaphoreAP.PIP:
+            elif self.localProtocol == SemaphoreAP.PIP:
                 if res == -1:
-                    self.semaphores[resource].elevate_priorities()
+                    self.inherit_priorities(self.semaphores[resource])
 
             return res
         return -1
 
+    def inherit_priorities(self, semaphore) -> None:
+        """pass the highest waiting priority of a semaphore on to its owner, and along the chain of blocked owners
+
+        Sections are not nested, so an owner holds a single semaphore and inherits exactly the
+        priority of its top waiter. Propagation stops at the first owner whose priority is unchanged.
+        """
+        while semaphore is not None and semaphore.owner is not None:
+            owner = semaphore.owner
+            priority = owner.get_priority()
+            owner.revert_priority(semaphore.get_priority())
+            if owner.get_priority() == priority:
+                break
+            semaphore = owner.blockedOn
+
     def signal(self, resource, job) -> int:
         if resource == 0:
             return 0
+        if self.accessProtocol == SemaphoreAP.SRP and resource in self.semaphores.keys():
+            semaphore = self.semaphores[resource]
+            res = semaphore.signal(job)
+            if res >= 0 and semaphore.owner is None:
+                self.lower_ceiling(resource)
+            return res
+        if resource in self.globalResources:
+            semaphore = self.semaphores[resource]
+            res = semaphore.signal(job)
+            job.revert_priority(-1)
+            if res >= 0 and semaphore.owner is not None:
+                semaphore.owner.elevate_priority(self.global_priority(resource))
+            return res
         if resource in self.semaphores.keys():
             res = self.semaphores[resource].signal(job)
 
-            if self.accessProtocol == SemaphoreAP.HLP:
+            if self.localProtocol == SemaphoreAP.HLP:
                 job.revert_priority(-1)
-            elif self.accessProtocol == SemaphoreAP.PIP:
+            elif self.localProtocol == SemaphoreAP.PIP:
                 if res >= 0:
                     job.revert_priority(-1)
-                    self.semaphores[resource].revert_priorities()
+                    self.inherit_priorities(self.semaphores[resource])
 
             return res
         return -1
@@ -52,82 +154,89 @@ class SemaphoreSet(object):
     def abandon(self, resource, job) -> int:
         if resource == 0:
             return 0
+        if self.accessProtocol == SemaphoreAP.SRP and resource in self.semaphores.keys():
+            semaphore = self.semaphores[resource]
+            owned = semaphore.owner is job
+            res = semaphore.abandon(job)
+            if owned and res >= 0 and semaphore.owner is None:
+                self.lower_ceiling(resource)
+            return res
+        if resource in self.globalResources:
+            semaphore = self.semaphores[resource]
+            res = semaphore.abandon(job)
+            job.revert_priority(-1)
+            if res >= 0 and semaphore.owner is not None:
+                semaphore.owner.elevate_priority(self.global_priority(resource))
+            return res
         if resource in self.semaphores.keys():
             res = self.semaphores[resource].abandon(job)
 
-            if self.accessProtocol == SemaphoreAP.HLP:
+            if self.localProtocol == SemaphoreAP.HLP:
                 job.revert_priority(-1)
-            elif self.accessProtocol == SemaphoreAP.PIP:
+            elif self.localProtocol == SemaphoreAP.PIP:
                 if res >= 0:
                     job.revert_priority(-1)
-                    self.semaphores[resource].revert_priorities()
+                    self.inherit_priorities(self.semaphores[resource])
 
             return res
         return -1
 
 
 class Semaphore:
+    """A binary semaphore with a priority-ordered queue of the jobs waiting for it.
+
+    The waiters live in a JobQueue, so queuing, handing over and abandoning are O(log n) and the
+    highest waiting priority is read off the top of the heap.
+    """
+
+    __slots__ = ['semaphore_id', 'lowest_priority', 'waiters', 'owner', 'taken']
+
     def __init__(self, semaphore_id, lowest_priority=1000):
         self.semaphore_id = semaphore_id
         self.lowest_priority = lowest_priority
-        self.priority = lowest_priority
-        self.elevated_priority = lowest_priority
-        self.jobs = []
+        self.waiters = JobQueue()
         self.owner = None
         self.taken = False
 
-    def elevate_priorities(self):
-        if self.priority < self.elevated_priority:
-            self.elevated_priority = self.priority
-            for job in self.jobs:
-                job.elevate_priority(self.priority)
-
-    def revert_priorities(self):
-        if self.elevated_priority < self.priority:
-            self.elevated_priority = self.priority
-            for job in self.jobs:
-                job.revert_priority(self.priority)
-
     def wait(self, job) -> int:
-        self.jobs.append(job)
-        self.jobs.sort()
-        self.priority = self.jobs[0].get_priority()
         if self.taken is True:
+            self.waiters.push(job)
+            job.blockedOn = self
             return -1
         self.owner = job
         self.taken = True
         return 0
 
     def signal(self, job) -> int:
-        self.jobs.remove(job)
         if self.owner == job:
-            if len(self.jobs) > 0:
-                self.owner = self.jobs[0]
-                self.priority = self.owner.get_priority()
+            if len(self.waiters) > 0:
+                self.owner = self.waiters.pop()
+                self.owner.blockedOn = None
                 self.owner.unblock()
                 return 1
 
             self.owner = None
-            self.priority = self.lowest_priority
             self.taken = False
             return 0
         return -1
 
     def abandon(self, job) -> int:
-        if job in self.jobs:
-            if self.owner == job:
-                return self.signal(job)
-            self.jobs.remove(job)
-            self.priority = self.jobs[0].get_priority()
+        if self.owner == job:
+            return self.signal(job)
+        if job in self.waiters:
+            self.waiters.remove(job)
+            job.blockedOn = None
             return 1
-        else:
-            return -1
+        return -1
 
     def is_taken(self) -> bool:
-        return self.is_taken()
+        return self.taken
 
     def get_priority(self) -> int:
-        return self.priority
+        """the highest priority among the waiting jobs"""
+        if len(self.waiters) > 0:
+            return self.waiters.peek().get_priority()
+        return self.lowest_priority
 
 
 EMPTY_SEM_SET = SemaphoreSet([])
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+sensitivity.py - critical scaling factor of the execution times of a task set under each access protocol
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from taskSet import TaskSet
+from semaphore import SemaphoreAP
+from simulator import Simulator, MissCheck
+from analysis import analyze, Verdict
+
+PROTOCOLS = {
+    'SIMPLE': SemaphoreAP.SIMPLE,
+    'HLP': SemaphoreAP.HLP,
+    'PIP': SemaphoreAP.PIP,
+}
+
+# factors tried by the analysis to bracket the search, 2 ** (-8) to 2 ** 8
+ANALYSIS_FACTORS = [2 ** (i / 8) for i in range(-64, 65)]
+
+
+def scaled_task_set(data, factor: float, task_ids: list[int] = None, steps: int = 100) -> TaskSet:
+    """the task set with the sections (and so the WCETs) of task_ids, or of every task, scaled by factor
+
+    Times are integer ticks of 1/steps of the task set's own tick, and every scaled section is
+    rounded to a whole number of them, at least one, so jobs still add up exactly.
+    """
+    tick = TaskSet(data, build_jobs=False, integer_time=True).tickFraction / steps
+    task_set = TaskSet(data, build_jobs=False, integer_time=True, tick=tick)
+    for task in task_set:
+        if task_ids is None or task.id in task_ids:
+            task.sectionTable = tuple((resource, max(1, round(length * factor)))
+                                      for resource, length in task.sectionTable)
+            task.wcet = sum(length for _, length in task.sectionTable)
+    return task_set
+
+
+def is_feasible(data, protocol: str, factor: float, task_ids: list[int] = None, steps: int = 100) -> bool:
+    """whether the scaled task set misses no deadline, simulated up to the first miss
+
+    The laxity check stops at a job that can no longer meet a deadline before the end of the
+    schedule, so the verdict is the one of the full simulation, found earlier.
+    """
+    task_set = scaled_task_set(data, factor, task_ids, steps)
+    return Simulator(task_set, PROTOCOLS[protocol], record_trace=False, detect_cycle=True,
+                     stop_at_miss=MissCheck.LAXITY).run().feasible
+
+
+def analysis_bracket(data, protocol: str, task_ids: list[int] = None, steps: int = 100) -> tuple[float, float | None]:
+    """the largest factor the analysis proves schedulable (0 if none) and the smallest it proves not (None if none)
+
+    All ANALYSIS_FACTORS go through one vectorized analysis; its verdicts are monotonic in the factor.
+    """
+    verdicts = analyze([scaled_task_set(data, factor, task_ids, steps) for factor in ANALYSIS_FACTORS],
+                       PROTOCOLS[protocol]).verdicts
+    low = max([factor for factor, verdict in zip(ANALYSIS_FACTORS, verdicts) if verdict == Verdict.SCHEDULABLE],
+              default=0.0)
+    high = min([factor for factor, verdict in zip(ANALYSIS_FACTORS, verdicts) if verdict == Verdict.UNSCHEDULABLE],
+               default=None)
+    return low, high
+
+
+def critical_scaling_factor(data, protocol: str, task_ids: list[int] = None, precision: float = 0.01,
+                            executor: ProcessPoolExecutor = None, workers: int = 1, max_factor: float = 256,
+                            steps: int = 100) -> float:
+    """the largest factor the execution times of task_ids (or all tasks) can be scaled by without a deadline miss
+
+    The analysis brackets the factor; candidates inside the bracket are then simulated, workers at
+    a time on executor if given, cutting the bracket into workers + 1 parts per round until it is
+    narrower than precision (relative). Returns max_factor if even that is feasible. The search
+    assumes that feasibility is monotonic in the factor, which scheduling anomalies can break.
+    """
+    def feasible(factors: list[float]) -> list[bool]:
+        if executor is None:
+            return [is_feasible(data, protocol, factor, task_ids, steps) for factor in factors]
+        futures = [executor.submit(is_feasible, data, protocol, factor, task_ids, steps) for factor in factors]
+        return [future.result() for future in futures]
+
+    low, high = analysis_bracket(data, protocol, task_ids, steps)
+    if high is None:
+        high = max(low, 1.0)
+        while high < max_factor and feasible([high])[0]:
+            low, high = high, min(high * 2, max_factor)
+        if high >= max_factor and feasible([max_factor])[0]:
+            return max_factor
+
+    while high - low > precision * max(low, precision):
+        candidates = [low + (high - low) * (i + 1) / (workers + 1) for i in range(workers)]
+        for factor, ok in zip(candidates, feasible(candidates)):
+            if not ok:
+                high = factor
+                break
+            low = factor
+    return low
+
+
+def sensitivity(data, protocols: list[str] = None, per_task: bool = False, precision: float = 0.01,
+                workers: int = 1) -> dict[str, float | dict[int, float]]:
+    """critical scaling factor under each protocol, of all tasks together or, with per_task, of each task alone"""
+    if protocols is None:
+        protocols = list(PROTOCOLS.keys())
+    task_ids = [task.id for task in TaskSet(data, build_jobs=False)]
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        results: dict[str, float | dict[int, float]] = {}
+        for protocol in protocols:
+            if per_task:
+                results[protocol] = {task_id: critical_scaling_factor(data, protocol, [task_id], precision, executor,
+                                                                      workers)
+                                     for task_id in task_ids}
+            else:
+                results[protocol] = critical_scaling_factor(data, protocol, None, precision, executor, workers)
+        return results
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('task_set', help='task set JSON file')
+    parser.add_argument('-p', '--protocols', nargs='+', choices=list(PROTOCOLS.keys()),
+                        default=list(PROTOCOLS.keys()))
+    parser.add_argument('--per-task', action='store_true', help='scale each task alone')
+    parser.add_argument('--precision', type=float, default=0.01, help='relative width of the final bracket')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of processes (default: all cores)')
+    args = parser.parse_args()
+
+    with open(args.task_set) as json_data:
+        data = json.load(json_data)
+
+    results = sensitivity(data, args.protocols, args.per_task, args.precision, args.workers or os.cpu_count() or 1)
+    for protocol, result in results.items():
+        if isinstance(result, dict):
+            for task_id, factor in result.items():
+                print(f"{protocol:<8}task {task_id:<6}{factor:.4f}")
+        else:
+            print(f"{protocol:<8}{result:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+"""
+service.py - local JSON-RPC schedulability service, simulating task sets on a process pool
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import stat
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from taskSet import TaskSet
+from semaphore import SemaphoreAP
+from simulator import Simulator, MissCheck, SchedulingPolicy
+from main import PROTOCOLS, result_to_dict
+
+SOCKET_NAME = 'schedulability.sock'
+LINE_LIMIT = 64 << 20  # longest request line, a whole task set
+
+
+def socket_directory() -> str:
+    """$XDG_RUNTIME_DIR, or else a directory of /tmp private to the user, created with mode 0700
+
+    A fixed path in a world-writable directory could be taken by another user first, so the
+    fallback is refused unless it is a directory owned by this user that nobody else can access.
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return runtime_dir
+    directory = os.path.join(tempfile.gettempdir(), f'schedulability-{os.getuid()}')
+    with contextlib.suppress(FileExistsError):
+        os.mkdir(directory, 0o700)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{directory} is not a directory private to this user")
+    return directory
+
+
+def default_socket() -> str:
+    return os.path.join(socket_directory(), SOCKET_NAME)
+
+
+class ErrorCode:
+    PARSE_ERROR = -32700
+    INVALID_REQUEST = -32600
+    METHOD_NOT_FOUND = -32601
+    INVALID_PARAMS = -32602
+    SIMULATION_ERROR = -32000
+    CANCELLED = -32800
+
+
+class ServiceError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+def check(params: dict) -> dict:
+    """simulate one task set, run in a worker process
+
+    params: taskSet (the task set JSON document), protocol (SIMPLE, HLP, PIP or SRP), and the
+    optional flags edf, feasibility, laxity (as in main.py), metrics and trace. The result is
+    main.result_to_dict plus the messages the task set printed while parsing and simulating,
+    and per-task metrics and the trace rows if asked for.
+    """
+    protocol = params.get('protocol', 'SIMPLE')
+    if protocol not in PROTOCOLS:
+        raise ValueError(f"unknown protocol '{protocol}', expected one of {', '.join(PROTOCOLS)}")
+    stop_at_miss = MissCheck.NONE
+    if params.get('feasibility', False):
+        stop_at_miss = MissCheck.LAXITY if params.get('laxity', False) else MissCheck.DEADLINE
+    policy = SchedulingPolicy.EDF if params.get('edf', False) else SchedulingPolicy.DEADLINE_MONOTONIC
+
+    messages = io.StringIO()
+    with contextlib.redirect_stdout(messages):
+        task_set = TaskSet(params['taskSet'], build_jobs=False)
+        simulator = Simulator(task_set, getattr(SemaphoreAP, protocol), record_trace=params.get('trace', False),
+                              record_metrics=params.get('metrics', False), stop_at_miss=stop_at_miss, policy=policy)
+        result = simulator.run()
+
+    response = result_to_dict(result, task_set.tick)
+    response['messages'] = messages.getvalue().splitlines()
+    if result.metrics is not None:
+        task_metrics = result.metrics.task_metrics().values()
+        response['metrics'] = dict(tasks=[vars(metrics) for metrics in task_metrics],
+                                   contextSwitches=result.metrics.contextSwitches)
+    if result.trace is not None:
+        tick = task_set.tick
+        response['trace'] = dict(columns=['Start', 'End', 'Task', 'Job', 'Resource'],
+                                 rows=[[start * tick, end * tick, task_id, job_id, resource]
+                                       for start, end, task_id, job_id, resource, _ in result.trace])
+    return response
+
+
+class SchedulabilityService(object):
+    """A JSON-RPC 2.0 server, one request or batch (a JSON array) per line, on a Unix socket or TCP.
+
+    Methods: check (see check()), cancel (params: id, a pending request of the same connection)
+    and ping. Requests of a connection are handled concurrently and answered as they finish.
+    At most max_pending checks wait for or run on the worker processes; further ones wait
+    for a slot. A cancelled check is answered with ErrorCode.CANCELLED; if a worker had already
+    started it, the worker finishes it and the result is dropped.
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.slots = asyncio.Semaphore(max_pending or self.workers * 4)
+        self.server: asyncio.AbstractServer | None = None
+
+    async def start_unix(self, path: str = None) -> str:
+        """listen on a Unix socket (by default default_socket()), replacing a stale socket file but
+        nothing else at path, returns the path"""
+        path = path or default_socket()
+        if os.path.lexists(path):
+            if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                raise FileExistsError(f"{path} exists and is not a socket")
+            try:
+                _, writer = await asyncio.open_unix_connection(path)
+            except ConnectionError:
+                os.remove(path)  # left behind by a service that has stopped
+            else:
+                writer.close()
+                raise FileExistsError(f"another service is listening on {path}")
+        self.server = await asyncio.start_unix_server(self.handle_connection, path, limit=LINE_LIMIT)
+        return path
+
+    async def start_tcp(self, host: str = '127.0.0.1', port: int = 8765) -> None:
+        self.server = await asyncio.start_server(self.handle_connection, host, port, limit=LINE_LIMIT)
+
+    async def serve_forever(self) -> None:
+        # start the workers now, so that the first request does not wait for them
+        await asyncio.gather(*[asyncio.get_running_loop().run_in_executor(self.executor, os.getpid)
+                               for _ in range(self.workers)])
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(cancel_futures=True)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        pending: dict = {}  # request id -> task, for cancel
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(message) -> None:
+            response = await self.dispatch_message(message, pending)
+            if response is not None and not writer.is_closing():
+                async with lock:
+                    writer.write(json.dumps(response).encode() + b'\n')
+                    with contextlib.suppress(ConnectionError):
+                        await writer.drain()
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    async with lock:
+                        error = self.error_response(None, ErrorCode.INVALID_REQUEST,
+                                                    f"request line longer than {LINE_LIMIT} bytes")
+                        writer.write(json.dumps(error).encode() + b'\n')
+                        await writer.drain()
+                    break
+                if len(line) == 0:
+                    break
+                if len(line.strip()) == 0:
+                    continue
+                task = asyncio.create_task(respond(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        finally:
+            for task in pending.values():
+                task.cancel()
+            for task in list(tasks):
+                task.cancel()
+            writer.close()
+
+    async def dispatch_message(self, line: bytes, pending: dict) -> dict | list | None:
+        try:
+            message = json.loads(line)
+        except ValueError as error:
+            return self.error_response(None, ErrorCode.PARSE_ERROR, str(error))
+        if isinstance(message, list):
+            if len(message) == 0:
+                return self.error_response(None, ErrorCode.INVALID_REQUEST, "empty batch")
+            responses = await asyncio.gather(*[self.dispatch(request, pending) for request in message])
+            responses = [response for response in responses if response is not None]
+            return responses if len(responses) > 0 else None
+        return await self.dispatch(message, pending)
+
+    async def dispatch(self, request, pending: dict) -> dict | None:
+        """the response to one request, None for a notification (a request without id)"""
+        if not isinstance(request, dict) or request.get('jsonrpc') != '2.0' or 'method' not in request:
+            return self.error_response(None, ErrorCode.INVALID_REQUEST, "not a JSON-RPC 2.0 request")
+        request_id = request.get('id')
+        params = request.get('params', {})
+        method = request['method']
+        if method == 'ping':
+            return self.result_response(request_id, 'pong')
+        if method == 'cancel':
+            task = pending.get(params.get('id')) if isinstance(params, dict) else None
+            if task is not None:
+                task.cancel()
+            return self.result_response(request_id, task is not None)
+        if method != 'check':
+            return self.error_response(request_id, ErrorCode.METHOD_NOT_FOUND, f"unknown method '{method}'")
+        if not isinstance(params, dict) or not isinstance(params.get('taskSet'), dict):
+            return self.error_response(request_id, ErrorCode.INVALID_PARAMS, "check needs a taskSet object")
+
+        task = asyncio.current_task()
+        if request_id is not None:
+            pending[request_id] = task
+        try:
+            async with self.slots:
+                result = await asyncio.get_running_loop().run_in_executor(self.executor, check, params)
+        except asyncio.CancelledError:
+            if request_id is None:
+                return None
+            return self.error_response(request_id, ErrorCode.CANCELLED, "cancelled")
+        except (KeyError, ValueError, TypeError, IndexError) as error:
+            return self.error_response(request_id, ErrorCode.INVALID_PARAMS, repr(error))
+        except Exception as error:
+            return self.error_response(request_id, ErrorCode.SIMULATION_ERROR, repr(error))
+        finally:
+            if pending.get(request_id) is task:
+                del pending[request_id]
+        return self.result_response(request_id, result) if request_id is not None else None
+
+    @staticmethod
+    def result_response(request_id, result) -> dict:
+        return dict(jsonrpc='2.0', id=request_id, result=result)
+
+    @staticmethod
+    def error_response(request_id, code: int, message: str) -> dict:
+        return dict(jsonrpc='2.0', id=request_id, error=dict(code=code, message=message))
+
+
+class ServiceClient(object):
+    """An asyncio client of a SchedulabilityService, calls can run concurrently on one connection."""
+
+    def __init__(self):
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+        self.ids = itertools.count(1)
+        self.calls: dict[int, asyncio.Future] = {}
+        self.readerTask: asyncio.Task | None = None
+
+    async def connect_unix(self, path: str = None) -> ServiceClient:
+        self.reader, self.writer = await asyncio.open_unix_connection(path or default_socket(), limit=LINE_LIMIT)
+        self.readerTask = asyncio.create_task(self.read_responses())
+        return self
+
+    async def connect_tcp(self, host: str = '127.0.0.1', port: int = 8765) -> ServiceClient:
+        self.reader, self.writer = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+        self.readerTask = asyncio.create_task(self.read_responses())
+        return self
+
+    async def read_responses(self) -> None:
+        while True:
+            line = await self.reader.readline()
+            if len(line) == 0:
+                break
+            message = json.loads(line)
+            for response in message if isinstance(message, list) else [message]:
+                future = self.calls.pop(response.get('id'), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        for future in self.calls.values():
+            if not future.done():
+                future.set_exception(ConnectionError("the service closed the connection"))
+
+    async def send(self, message) -> None:
+        self.writer.write(json.dumps(message).encode() + b'\n')
+        await self.writer.drain()
+
+    def request(self, method: str, params=None) -> tuple[dict, asyncio.Future]:
+        request_id = next(self.ids)
+        self.calls[request_id] = asyncio.get_running_loop().create_future()
+        return dict(jsonrpc='2.0', id=request_id, method=method, params=params or {}), self.calls[request_id]
+
+    @staticmethod
+    def unwrap(response: dict):
+        if 'error' in response:
+            raise ServiceError(response['error']['code'], response['error']['message'])
+        return response['result']
+
+    async def call(self, method: str, params=None):
+        """the result of a call, raises ServiceError for an error response"""
+        request, future = self.request(method, params)
+        await self.send(request)
+        return self.unwrap(await future)
+
+    async def call_batch(self, calls: list[tuple[str, dict]]) -> list:
+        """the results of several calls sent as one batch, ServiceError instances for the failed ones"""
+        requests, futures = zip(*[self.request(method, params) for method, params in calls])
+        await self.send(list(requests))
+        results = []
+        for response in await asyncio.gather(*futures):
+            try:
+                results.append(self.unwrap(response))
+            except ServiceError as error:
+                results.append(error)
+        return results
+
+    def submit(self, method: str, params=None) -> tuple[int, asyncio.Task]:
+        """start a call, returns its id (for cancel) and a task for its result"""
+        request, future = self.request(method, params)
+        return request['id'], asyncio.create_task(self.send_and_wait(request, future))
+
+    async def send_and_wait(self, request: dict, future: asyncio.Future):
+        await self.send(request)
+        return self.unwrap(await future)
+
+    async def cancel(self, request_id: int) -> bool:
+        return await self.call('cancel', dict(id=request_id))
+
+    async def check(self, task_set: dict, protocol: str = 'SIMPLE', **options) -> dict:
+        return await self.call('check', dict(taskSet=task_set, protocol=protocol, **options))
+
+    async def close(self) -> None:
+        self.writer.close()
+        await self.writer.wait_closed()
+        if self.readerTask is not None:
+            await self.readerTask
+
+
+async def serve(args) -> None:
+    service = SchedulabilityService(args.workers, args.max_pending)
+    try:
+        if args.port is not None:
+            await service.start_tcp(args.host, args.port)
+            print(f"listening on {args.host}:{args.port}")
+        else:
+            path = await service.start_unix(args.socket)
+            print(f"listening on {path}")
+        await service.serve_forever()
+    finally:
+        await service.close()
+
+
+async def run_client(args) -> int:
+    client = ServiceClient()
+    if args.port is not None:
+        await client.connect_tcp(args.host, args.port)
+    else:
+        await client.connect_unix(args.socket)
+    try:
+        calls = []
+        for path in args.task_sets:
+            with open(path) as json_data:
+                calls.append(('check', dict(taskSet=json.load(json_data), protocol=args.protocol, edf=args.edf,
+                                            feasibility=args.feasibility, metrics=args.metrics, trace=args.trace)))
+        results = await client.call_batch(calls)
+    finally:
+        await client.close()
+    status = 0
+    for path, result in zip(args.task_sets, results):
+        if isinstance(result, ServiceError):
+            print(f"{path}: error {result.code}: {result}", file=sys.stderr)
+            status = 2
+        else:
+            print(json.dumps(dict(taskSet=path, **result), indent=4))
+            if not result['feasible']:
+                status = max(status, 1)
+    return status
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--socket', default=None,
+                        help='Unix socket path (default: schedulability.sock in $XDG_RUNTIME_DIR, or else in '
+                             'a directory of /tmp private to the user)')
+    parser.add_argument('--port', type=int, default=None, help='use TCP on this port instead of the Unix socket')
+    parser.add_argument('--host', default='127.0.0.1')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help='run the service')
+    serve_parser.add_argument('-j', '--workers', type=int, default=None,
+                              help='number of processes (default: all cores)')
+    serve_parser.add_argument('--max-pending', type=int, default=None,
+                              help='checks queued or running at once (default: 4 per worker)')
+    check_parser = commands.add_parser('check', help='check task set files with a running service, as one batch')
+    check_parser.add_argument('task_sets', nargs='+', help='task set JSON files')
+    check_parser.add_argument('-p', '--protocol', choices=PROTOCOLS, default='SIMPLE')
+    check_parser.add_argument('--edf', action='store_true')
+    check_parser.add_argument('-f', '--feasibility', action='store_true', help='stop at the first deadline miss')
+    check_parser.add_argument('--metrics', action='store_true')
+    check_parser.add_argument('--trace', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            pass
+        except OSError as error:
+            print(f"error: {error}", file=sys.stderr)
+            return 1
+        return 0
+    return asyncio.run(run_client(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,462 @@
+from __future__ import annotations
+import copy
+import itertools
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+from job import Job, JobState
+from jobQueue import JobQueue
+from scheduleTrace import ScheduleTrace
+from taskSet import TaskSet, EventType, EventListSource
+from semaphore import SemaphoreSet, SemaphoreAP
+from metrics import MetricsRecorder
+from traceFile import TraceWriter
+
+
+class SchedulingPolicy:
+    DEADLINE_MONOTONIC = 0  # Fixed priorities, the relative deadline of the task
+    EDF = 1  # Earliest deadline first, the absolute deadline of the job
+
+
+class MissCheck:
+    NONE = 0  # Simulate the whole schedule
+    DEADLINE = 1  # Stop at the first deadline event that finds its job unfinished
+    LAXITY = 2  # Also stop at the first event where a pending job can no longer finish before its deadline
+
+
+class SimulationResult(object):
+    """Outcome of a simulation.
+
+    maxResponseTimes holds the worst response time of the completed jobs of each task.
+    missCount and executedTime cover the whole schedule. When a steady-state cycle was
+    detected, cycle is its (start, length) and those two are extrapolated from it, while
+    trace and deadlineMisses only hold what was actually simulated. metrics is the
+    MetricsRecorder of a simulation run with record_metrics, None otherwise. firstMissTime is
+    when the first deadline miss was detected, None if there was none.
+    """
+
+    def __init__(self, trace: ScheduleTrace, deadline_misses: list[Job], end_time: float,
+                 miss_count: int = None, executed_time: dict[int, float] = None,
+                 cycle: tuple[float, float] = None, max_response_times: dict[int, float] = None,
+                 metrics: MetricsRecorder = None, first_miss_time: float = None):
+        self.trace = trace
+        self.deadlineMisses = deadline_misses
+        self.feasible = len(deadline_misses) == 0
+        self.endTime = end_time
+        self.missCount = len(deadline_misses) if miss_count is None else miss_count
+        self.executedTime = executed_time if executed_time is not None else {}
+        self.cycle = cycle
+        self.maxResponseTimes = max_response_times if max_response_times is not None else {}
+        self.metrics = metrics
+        self.firstMissTime = first_miss_time
+
+
+class Checkpoint(object):
+    """A copy of a simulator's state at time, taken before the events at that time are handled.
+
+    Tasks and the task set are shared with the simulator rather than copied, the trace is only
+    marked. So are the deadline misses, cycle snapshots and job metrics, which only grow: the
+    state shares them, historyMark holds their lengths and copies of the metrics of pending jobs.
+    """
+
+    def __init__(self, time: float, task_set: TaskSet, state: dict, trace_mark: tuple | None, history_mark: tuple):
+        self.time = time
+        self.taskSet = task_set
+        self.state = state
+        self.traceMark = trace_mark
+        self.historyMark = history_mark
+
+
+def first_changed_release(old: TaskSet, new: TaskSet) -> float:
+    """the first release of a task whose WCET or sections differ between two task sets
+
+    Raises ValueError if they differ in anything else: other task parameters, the schedule window,
+    the release times, the tick or the resource ceilings.
+    """
+    if old.tasks.keys() != new.tasks.keys():
+        raise ValueError("the task sets have different tasks")
+    if (old.startTime, old.endTime, old.releaseTimes, old.tick) != (new.startTime, new.endTime, new.releaseTimes,
+                                                                    new.tick):
+        raise ValueError("the task sets have different schedule windows, release times or ticks")
+    if old.get_all_resources() != new.get_all_resources() or \
+            old.get_highest_priorities() != new.get_highest_priorities() or \
+            old.get_lowest_priority() != new.get_lowest_priority():
+        raise ValueError("the task sets have different resource ceilings")
+
+    first_release = float('inf')
+    for task in new:
+        old_task = old.get_task_by_id(task.id)
+        if (old_task.period, old_task.offset, old_task.relativeDeadline) != \
+                (task.period, task.offset, task.relativeDeadline):
+            raise ValueError(f"task {task.id} has a different period, offset or deadline")
+        if (old_task.wcet, old_task.sectionTable) == (task.wcet, task.sectionTable):
+            continue
+        if new.releaseTimes is not None:
+            releases = [time for time, task_id in new.releaseTimes if task_id == task.id and time >= new.startTime]
+            first_release = min([first_release] + releases[:1])
+        else:
+            first_release = min(first_release, max(task.offset, new.startTime))
+    return first_release
+
+
+class Simulator(object):
+    """Uniprocessor scheduler for the jobs of a TaskSet.
+
+    The simulation advances from event to event: step() handles the events at the current
+    time and simulates up to the next one, run_until(t) simulates up to (but not including
+    the events at) time t, and run() simulates the whole schedule. Events come from
+    TaskSet.event_source(), so a TaskSet built with build_jobs=False spawns its jobs lazily.
+    A run never writes to its TaskSet: the jobs it mutates are its own, so one parsed TaskSet
+    can be simulated any number of times, under different protocols or concurrently in threads.
+
+    With detect_cycle, the state of a periodic task set is compared at every hyperperiod
+    boundary after the largest offset. Once it repeats, the schedule is periodic from then
+    on, so only the part of the last cycle that fits before the end is simulated and the
+    rest is extrapolated.
+
+    With record_metrics, a MetricsRecorder collects per-job response, blocking, preemption and
+    inheritance figures. With trace_path, the trace is streamed to that file by a TraceWriter
+    instead of kept in memory; result() flushes it and closes it once the schedule has ended.
+
+    stop_at_miss ends the simulation at the first deadline miss, for when only feasibility
+    matters. With MissCheck.LAXITY, a job that could not finish in time even if it ran alone
+    from now on counts as missed right away, if its deadline falls before the end of the
+    schedule. missCount then only counts the misses found up to the stop, without
+    extrapolation.
+
+    checkpoint() and restore() save and bring back the whole simulation state. With
+    checkpoint_interval, a checkpoint is kept at the first event at least that long after the
+    previous one, and what_if() uses them to simulate a variant of the task set from the latest
+    checkpoint that precedes its first change instead of from the start.
+
+    Under SchedulingPolicy.EDF, jobs enter the ready queue with their absolute deadline as
+    priority, so it stays ordered without re-sorting. EDF works with SIMPLE, PIP (inheriting
+    deadlines) and SRP; the fixed ceilings of HLP do not apply to it.
+
+    execution_times, if given, is asked for the sections of every job as it is released (see
+    monteCarlo.SampledExecutionTimes); None keeps the sections of the task.
+    """
+
+    UNCHECKPOINTED = ('taskSet', 'trace', 'checkpoints')
+
+    def __init__(self, task_set: TaskSet, access_protocol: SemaphoreAP = SemaphoreAP.SIMPLE,
+                 record_trace: bool = True, detect_cycle: bool = False, record_metrics: bool = False,
+                 trace_path: str = None, stop_at_miss: MissCheck = MissCheck.NONE,
+                 checkpoint_interval: float = None,
+                 policy: SchedulingPolicy = SchedulingPolicy.DEADLINE_MONOTONIC, execution_times=None):
+        if policy == SchedulingPolicy.EDF and access_protocol not in [SemaphoreAP.SIMPLE, SemaphoreAP.PIP,
+                                                                      SemaphoreAP.SRP]:
+            raise ValueError("EDF supports the SIMPLE, PIP and SRP access protocols")
+        if execution_times is not None and detect_cycle:
+            raise ValueError("sampled execution times do not repeat, detect_cycle cannot be used with them")
+        self.taskSet = task_set
+        self.accessProtocol = access_protocol
+        self.policy = policy
+        self.executionTimes = execution_times
+        self.eventSource = task_set.event_source()
+        self.currTime, self.pendingEvents = self.eventSource.pop()
+        self.eventsHandled = False
+        self.readyQueue = JobQueue()
+        self.waitingQueue = JobQueue()
+        lowest_priority = task_set.get_lowest_priority() if policy != SchedulingPolicy.EDF else float('inf')
+        self.semaphores = SemaphoreSet(task_set.get_all_resources(), lowest_priority, access_protocol,
+                                       task_set.get_highest_priorities())
+        self.tick = task_set.tick
+        self.trace = self.make_trace(1, record_trace, trace_path)
+        self.metrics = MetricsRecorder(self.tick) if record_metrics else None
+        self.deadlineMisses: list[Job] = []
+        self.executedTime: dict[int, float] = {}
+        self.maxResponseTimes: dict[int, float] = {}
+        self.eventCount = 0
+        self.stopAtMiss = stop_at_miss
+        self.firstMissTime: float | None = None
+
+        self.stopTime = float('inf')
+        self.hyperperiod = task_set.get_hyperperiod() if detect_cycle else None
+        self.firstBoundary = 0.0
+        self.boundaryIdx = 0
+        self.snapshots: dict[tuple, tuple[float, int, dict[int, float]]] = {}
+        self.cycle: tuple[float, float] | None = None
+        self.cycleRepeats = 0
+        self.cycleMisses = 0
+        self.cycleExecutedTime: dict[int, float] = {}
+        if self.hyperperiod is not None:
+            self.firstBoundary = max([task_set.startTime] + [task.offset for task in task_set])
+
+        self.checkpointInterval = checkpoint_interval
+        self.nextCheckpointTime = float('-inf')
+        self.checkpoints: list[Checkpoint] | None = [] if checkpoint_interval is not None else None
+
+    def make_trace(self, cores: int, record_trace: bool, trace_path: str):
+        if trace_path is not None:
+            return TraceWriter(trace_path, cores, self.tick)
+        return ScheduleTrace(cores, self.tick) if record_trace else None
+
+    def is_finished(self) -> bool:
+        return self.eventSource.next_time() is None or self.currTime >= self.stopTime
+
+    def handle_events(self) -> None:
+        self.eventCount += len(self.pendingEvents)
+        for event in self.pendingEvents:
+            if event[0] == EventType.RELEASE:
+                if self.policy == SchedulingPolicy.EDF:
+                    event[1].set_base_priority(event[1].get_deadline())
+                if self.executionTimes is not None:
+                    sections = self.executionTimes.sections(event[1])
+                    if sections is not None:
+                        event[1].set_sections(sections)
+                event[1].release(self.semaphores, self.ready_queue_for(event[1]), self.waitingQueue)
+                if self.metrics is not None:
+                    self.metrics.on_release(event[1], self.currTime)
+            elif event[0] == EventType.DEADLINE:
+                if event[1].end() == -1:
+                    self.deadlineMisses.append(event[1])
+                    if self.metrics is not None:
+                        self.metrics.on_miss(event[1])
+        if self.stopAtMiss == MissCheck.LAXITY and len(self.deadlineMisses) == 0:
+            for _, job in self.pending_jobs():
+                # deadlines at or after the end of the schedule are never checked
+                if job.get_deadline() >= self.taskSet.endTime:
+                    continue
+                if job.get_deadline() - self.currTime < job.remaining_execution_time:
+                    self.deadlineMisses.append(job)
+                    break
+        if self.firstMissTime is None and len(self.deadlineMisses) > 0:
+            self.firstMissTime = self.currTime
+            if self.stopAtMiss != MissCheck.NONE:
+                self.stopTime = self.currTime
+                self.cycleRepeats = 0
+        self.eventsHandled = True
+
+    def ready_queue_for(self, job: Job) -> JobQueue:
+        return self.readyQueue
+
+    def pending_jobs(self):
+        """(processor, job) pairs of the released jobs"""
+        for job in self.readyQueue:
+            yield 0, job
+        for job in self.waitingQueue:
+            yield 0, job
+
+    def record(self, job: Job, start: float, progression: float, resource: int, core: int = 0) -> None:
+        """account for a job having executed from start for progression"""
+        task_id = job.task.id
+        self.executedTime[task_id] = self.executedTime.get(task_id, 0) + progression
+        if self.trace is not None:
+            self.trace.add(start, start + progression, task_id, job.id, resource, core)
+        if job.state == JobState.ENDED:
+            response_time = start + progression - job.get_release_time()
+            if response_time > self.maxResponseTimes.get(task_id, 0):
+                self.maxResponseTimes[task_id] = response_time
+
+    def execute_until(self, time: float) -> None:
+        while self.currTime < time:
+            if len(self.readyQueue) == 0:
+                if self.metrics is not None:
+                    self.metrics.on_interval(self.currTime, time - self.currTime, [], self.pending_jobs())
+                self.currTime = time
+            else:
+                selected_job = self.readyQueue.peek()
+                progression, resource = selected_job.execute(time - self.currTime)
+                if progression > 0:
+                    self.record(selected_job, self.currTime, progression, resource)
+                    if self.metrics is not None:
+                        self.metrics.on_interval(self.currTime, progression, [(0, selected_job)],
+                                                 self.pending_jobs())
+                self.currTime += progression
+
+    def advance(self, time: float) -> None:
+        while not self.is_finished():
+            if not self.eventsHandled:
+                if self.currTime >= time:
+                    break
+                if self.checkpoints is not None and self.currTime >= self.nextCheckpointTime:
+                    self.checkpoints.append(self.checkpoint())
+                    self.nextCheckpointTime = self.currTime + self.checkpointInterval
+                self.handle_events()
+            next_event_time = self.eventSource.next_time()
+            self.execute_until(min(next_event_time, time, self.stopTime))
+            if self.currTime < next_event_time:
+                break
+            _, self.pendingEvents = self.eventSource.pop()
+            self.eventsHandled = False
+
+    def run_until(self, time: float) -> SimulationResult:
+        while self.hyperperiod is not None and self.cycle is None and not self.is_finished():
+            boundary = self.firstBoundary + self.boundaryIdx * self.hyperperiod
+            if boundary >= time:
+                break
+            self.advance(boundary)
+            if self.currTime < boundary:
+                break
+            self.check_cycle(boundary)
+            self.boundaryIdx += 1
+        self.advance(time)
+        return self.result()
+
+    def step(self) -> bool:
+        """simulate one event interval, returns False once the schedule has ended"""
+        if not self.is_finished():
+            self.run_until(min(self.eventSource.next_time(), self.stopTime))
+        return not self.is_finished()
+
+    def run(self) -> SimulationResult:
+        return self.run_until(float('inf'))
+
+    def checkpoint(self) -> Checkpoint:
+        """a copy of the current state, jobs, queues, semaphores, events and metrics included"""
+        state = {name: value for name, value in vars(self).items() if name not in self.UNCHECKPOINTED}
+        memo = {id(self.taskSet): self.taskSet}
+        for task in self.taskSet:
+            memo[id(task)] = task
+        self.share_prebuilt_events(self.eventSource, memo)
+        self.share_history(state, memo)
+        history_mark = (len(self.deadlineMisses), len(self.snapshots),
+                        self.metrics.mark() if self.metrics is not None else None)
+        return Checkpoint(self.currTime, self.taskSet, copy.deepcopy(state, memo),
+                          self.trace.mark() if self.trace is not None else None, history_mark)
+
+    @staticmethod
+    def share_prebuilt_events(event_source, memo: dict) -> None:
+        """keep the events of an EventListSource out of a copy, runs never write to them"""
+        if isinstance(event_source, EventListSource):
+            memo[id(event_source.events)] = event_source.events
+            memo[id(event_source.eventList)] = event_source.eventList
+            for job in event_source.runJobs:
+                memo[id(job)] = job
+
+    @staticmethod
+    def share_history(state: dict, memo: dict) -> None:
+        """keep the lists that only grow out of a copy, a checkpoint marks their lengths instead
+
+        They are never truncated in place, restore() replaces them by their prefix, so the
+        lists a checkpoint shares keep what it needs.
+        """
+        memo[id(state['deadlineMisses'])] = state['deadlineMisses']
+        memo[id(state['snapshots'])] = state['snapshots']
+        if state['metrics'] is not None:
+            memo[id(state['metrics'].jobs)] = state['metrics'].jobs
+
+    def restore(self, checkpoint: Checkpoint) -> None:
+        """go back to a checkpoint, which stays usable
+
+        The tasks of the checkpoint are replaced by the tasks with the same id of this simulator's
+        task set, and jobs that are about to be released take their parameters from them.
+        """
+        memo = {id(checkpoint.taskSet): self.taskSet}
+        for task in checkpoint.taskSet:
+            memo[id(task)] = self.taskSet.get_task_by_id(task.id)
+        self.share_prebuilt_events(checkpoint.state['eventSource'], memo)
+        self.share_history(checkpoint.state, memo)
+        vars(self).update(copy.deepcopy(checkpoint.state, memo))
+        misses, snapshots, metrics = checkpoint.historyMark
+        self.deadlineMisses = self.deadlineMisses[:misses]
+        self.snapshots = dict(itertools.islice(self.snapshots.items(), snapshots))
+        if metrics is not None:
+            self.metrics.rewind(metrics)
+        if not self.eventsHandled:
+            for event in self.pendingEvents:
+                if event[0] == EventType.RELEASE and event[1].state == JobState.CREATED:
+                    event[1].reset()
+        if self.trace is not None and checkpoint.traceMark is not None:
+            self.trace.rewind(checkpoint.traceMark)
+
+    def what_if(self, task_set: TaskSet) -> Simulator:
+        """a simulator of a variant of the task set that only changes WCETs and sections
+
+        It resumes from the latest checkpoint before the first release of a changed task and keeps
+        the checkpoints up to it; run() completes it. Its trace is a copy of the one recorded up to
+        the checkpoint, or None for a trace streamed to a file. Raises ValueError for other
+        changes (see first_changed_release) and for task sets with prebuilt jobs.
+        """
+        if self.checkpoints is None:
+            raise ValueError("what_if needs a simulator with a checkpoint_interval")
+        if isinstance(self.eventSource, EventListSource):
+            raise ValueError("what_if needs task sets built with build_jobs=False")
+        first_releases: dict[int, float] = {}
+        for idx in range(len(self.checkpoints) - 1, -1, -1):
+            checkpoint = self.checkpoints[idx]
+            if id(checkpoint.taskSet) not in first_releases:
+                first_releases[id(checkpoint.taskSet)] = first_changed_release(checkpoint.taskSet, task_set)
+            if checkpoint.time <= first_releases[id(checkpoint.taskSet)]:
+                break
+        else:
+            raise ValueError("no checkpoint precedes the first changed release")
+
+        simulator = copy.copy(self)
+        simulator.taskSet = task_set
+        simulator.checkpoints = self.checkpoints[:idx + 1]
+        simulator.trace = None
+        if isinstance(self.trace, ScheduleTrace):
+            simulator.trace = self.trace.prefix(checkpoint.traceMark)
+        simulator.restore(checkpoint)
+        return simulator
+
+    def job_key(self, job: Job, boundary: float) -> tuple:
+        return job.task.id, job.get_release_time() - boundary
+
+    def snapshot(self, boundary: float) -> tuple:
+        """the simulator state relative to a hyperperiod boundary, hashable for comparison"""
+        jobs = []
+        # EDF priorities are absolute deadlines, compared relative to the boundary like release times
+        offset = boundary if self.policy == SchedulingPolicy.EDF else 0
+        for queue in [self.readyQueue, self.waitingQueue]:
+            jobs.append(tuple((self.job_key(job, boundary), job.state, job.priority - offset,
+                               job.remaining_execution_time, job.currSectionIdx, job.get_remaining_section_time(),
+                               job.gotLock)
+                              for job in queue.ordered()))
+        semaphores = []
+        for resource, semaphore in self.semaphores.semaphores.items():
+            owner = self.job_key(semaphore.owner, boundary) if semaphore.owner is not None else None
+            waiters = tuple(self.job_key(job, boundary) for job in semaphore.waiters.ordered())
+            semaphores.append((resource, owner, waiters))
+        return self.eventsHandled, tuple(jobs), tuple(semaphores)
+
+    def check_cycle(self, boundary: float) -> None:
+        state = self.snapshot(boundary)
+        if state not in self.snapshots:
+            self.snapshots[state] = (boundary, len(self.deadlineMisses), dict(self.executedTime))
+            return
+
+        cycle_start, cycle_start_misses, cycle_start_executed = self.snapshots[state]
+        cycle_length = boundary - cycle_start
+        self.cycle = (cycle_start, cycle_length)
+        self.cycleRepeats = math.floor((self.taskSet.endTime - boundary) / cycle_length)
+        self.stopTime = self.taskSet.endTime - self.cycleRepeats * cycle_length
+        self.cycleMisses = len(self.deadlineMisses) - cycle_start_misses
+        self.cycleExecutedTime = {task_id: executed - cycle_start_executed.get(task_id, 0)
+                                  for task_id, executed in self.executedTime.items()}
+        self.snapshots = {}
+
+    def result(self) -> SimulationResult:
+        """the outcome so far, with times converted back from ticks"""
+        tick = self.tick
+        if isinstance(self.trace, TraceWriter):
+            if self.is_finished():
+                self.trace.close()
+            else:
+                self.trace.flush()
+        miss_count = len(self.deadlineMisses) + self.cycleRepeats * self.cycleMisses
+        executed_time = {task_id: (executed + self.cycleRepeats * self.cycleExecutedTime.get(task_id, 0)) * tick
+                         for task_id, executed in self.executedTime.items()}
+        cycle = (self.cycle[0] * tick, self.cycle[1] * tick) if self.cycle is not None else None
+        max_response_times = {task_id: response_time * tick for task_id, response_time in self.maxResponseTimes.items()}
+        return SimulationResult(self.trace, list(self.deadlineMisses), self.currTime * tick, miss_count, executed_time,
+                                cycle, max_response_times, self.metrics,
+                                self.firstMissTime * tick if self.firstMissTime is not None else None)
+
+
+def simulate_protocols(task_set: TaskSet, access_protocols: list[SemaphoreAP], threads: int = 1,
+                       **options) -> dict[SemaphoreAP, SimulationResult]:
+    """the results of simulating one parsed task set under each access protocol, threads runs at a time
+
+    options are passed to every Simulator; a trace_path would be shared, so it is not allowed.
+    """
+    if 'trace_path' in options:
+        raise ValueError("simulate_protocols cannot stream several traces to one trace_path")
+    if threads <= 1:
+        return {protocol: Simulator(task_set, protocol, **options).run() for protocol in access_protocols}
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = {protocol: executor.submit(lambda p: Simulator(task_set, p, **options).run(), protocol)
+                   for protocol in access_protocols}
+        return {protocol: future.result() for protocol, future in futures.items()}
@@ -24,6 +24,9 @@ class TaskSetJsonKeys(object):
 
 
 class Task(object):
+    __slots__ = ['id', 'period', 'wcet', 'relativeDeadline', 'offset', 'sections', 'sectionTable', 'lastJobId',
+                 'lastReleasedTime', 'jobs', 'tick']
+
     def __init__(self, task_dict):
         self.id = 0
         self.period = 0
@@ -39,7 +42,10 @@ class Task(object):
                 task_dict.get(TaskSetJsonKeys.KEY_TASK_DEADLINE, task_dict[TaskSetJsonKeys.KEY_TASK_PERIOD]))
             self.offset = float(task_dict.get(TaskSetJsonKeys.KEY_TASK_OFFSET, 0.0))
             self.sections = task_dict[TaskSetJsonKeys.KEY_TASK_SECTIONS]
+        # shared by all jobs of the task, which only keep a cursor into it
+        self.sectionTable: tuple[tuple[int, float], ...] = tuple((section[0], section[1]) for section in self.sections)
 
+        self.tick = 1  # length of one time unit, set by TaskSet when it converts times to ticks
         self.lastJobId = 0
         self.lastReleasedTime = 0.0
 
@@ -58,13 +64,19 @@ class Task(object):
             resources.pop(0)
         return resources
 
-    def spawn_job(self, release_time) -> Job:
-        if self.lastReleasedTime > 0 and release_time < self.lastReleasedTime:
+    def is_valid_release(self, last_released_time, release_time) -> bool:
+        if last_released_time > 0 and release_time < last_released_time:
             print("INVALID: release time of job is not monotonic")
-            return EMPTY_JOB
+            return False
 
-        if self.lastReleasedTime > 0 and release_time < self.lastReleasedTime + self.period:
+        if last_released_time > 0 and release_time < last_released_time + self.period:
             print("INVDALID: release times are not separated by period")
+            return False
+
+        return True
+
+    def spawn_job(self, release_time) -> Job:
+        if not self.is_valid_release(self.lastReleasedTime, release_time):
             return EMPTY_JOB
 
         self.lastJobId += 1
@@ -102,8 +114,11 @@ class Task(object):
             return self.wcet / self.period
 
     def __str__(self) -> str:
-        return "task {0}: (Φ,T,C,D,∆) = ({1}, {2}, {3}, {4}, {5})".format(self.id, self.offset, self.period, self.wcet,
-                                                                          self.relativeDeadline, self.sections)
+        return "task {0}: (Φ,T,C,D,∆) = ({1}, {2}, {3}, {4}, {5})".format(self.id, self.offset * self.tick,
+                                                                          self.period * self.tick,
+                                                                          self.wcet * self.tick,
+                                                                          self.relativeDeadline * self.tick,
+                                                                          self.sections)
 
 
 EMPTY_TASK = Task(None)
@@ -2,6 +2,9 @@ from job import Job, EMPTY_JOB
 from task import Task, EMPTY_TASK
 from task import TaskSetJsonKeys as TSJK
 from semaphore import Semaphore, SemaphoreSet
+import heapq
+import math
+from fractions import Fraction
 
 
 class EventType:
@@ -33,14 +36,166 @@ def add_job(jobs: list[Job], events: dict[float, list[tuple[EventType, Job]]], j
         events[deadline].append((EventType.DEADLINE, job))
 
 
+class EventListSource(object):
+    """Event source over the events prebuilt by TaskSet.build_job_releases.
+
+    The prebuilt jobs stay untouched: each release event hands out a fresh copy of its job,
+    which the deadline event of that job refers to, so the events can drive any number of runs.
+    """
+
+    def __init__(self, events: dict[float, list[tuple[EventType, Job]]], event_list: list[float]):
+        self.events = events
+        self.eventList = event_list
+        self.index = 0
+        self.runJobs: dict[Job, Job] = {}  # prebuilt job -> its copy in this run, until its deadline
+
+    def next_time(self) -> float | None:
+        if self.index < len(self.eventList):
+            return self.eventList[self.index]
+        return None
+
+    def pop(self) -> tuple[float, list[tuple[EventType, Job]]]:
+        event_time = self.eventList[self.index]
+        self.index += 1
+        events: list[tuple[EventType, Job]] = []
+        for event_type, job in self.events[event_time]:
+            if event_type == EventType.RELEASE and job.task is not None:
+                self.runJobs[job] = Job(job.task, job.id, job.releaseTime)
+                events.append((event_type, self.runJobs[job]))
+            elif event_type == EventType.DEADLINE:
+                events.append((event_type, self.runJobs.pop(job, job)))
+            else:
+                events.append((event_type, job))
+        return event_time, events
+
+
+class EventSource(object):
+    """Lazy release/deadline events of a TaskSet, generated from a min-heap.
+
+    The heap holds at most one pending release per periodic task (one in total for the
+    release times of sporadic task sets) plus the deadlines of released jobs, so memory
+    stays proportional to the number of tasks and live jobs whatever the schedule length.
+    Events at the same time come out in the order build_job_releases would list them.
+    """
+
+    PENDING = 0  # a release of the task that has not been spawned yet
+    DEADLINE = 1
+    END = 2
+
+    def __init__(self, task_set):
+        self.taskSet = task_set
+        self.endTime = task_set.endTime
+        self.heap: list[tuple] = []
+        self.lastJobIds: dict[int, int] = {}
+        self.lastReleasedTimes: dict[int, float] = {}
+        self.releases = None
+        self.releaseSeq = 0
+
+        if task_set.releaseTimes is not None:
+            self.releases = iter(task_set.releaseTimes)
+            self.push_next_release()
+        else:
+            for task_idx, task in enumerate(task_set):
+                release_time = max(task.offset, task_set.startTime)
+                if release_time < self.endTime:
+                    heapq.heappush(self.heap, (release_time, (task_idx, 1), self.PENDING, task))
+        heapq.heappush(self.heap, (self.endTime, (float('inf'),), self.END, None))
+
+    def push_next_release(self) -> None:
+        for release_time, task_id in self.releases:
+            self.releaseSeq += 1
+            if release_time >= self.taskSet.startTime:
+                if task_id not in self.taskSet:
+                    print(f"INVALID: release of unknown task {task_id}")
+                    continue
+                task = self.taskSet.get_task_by_id(task_id)
+                heapq.heappush(self.heap, (release_time, (self.releaseSeq, 0), self.PENDING, task))
+                return
+
+    def spawn(self, task: Task, release_time: float) -> Job:
+        last_released_time = self.lastReleasedTimes.get(task.id, 0.0)
+        if not task.is_valid_release(last_released_time, release_time):
+            return EMPTY_JOB
+        job_id = self.lastJobIds.get(task.id, 0) + 1
+        self.lastJobIds[task.id] = job_id
+        self.lastReleasedTimes[task.id] = release_time
+        return Job(task, job_id, release_time)
+
+    def next_time(self) -> float | None:
+        if len(self.heap) > 0:
+            return self.heap[0][0]
+        return None
+
+    def pop(self) -> tuple[float, list[tuple[EventType, Job]]]:
+        event_time = self.heap[0][0]
+        events: list[tuple[EventType, Job]] = []
+        while len(self.heap) > 0 and self.heap[0][0] == event_time:
+            _, rank, kind, item = heapq.heappop(self.heap)
+            if kind == self.DEADLINE:
+                events.append((EventType.DEADLINE, item))
+            elif kind == self.PENDING:
+                job = self.spawn(item, event_time)
+                if job is not EMPTY_JOB:
+                    events.append((EventType.RELEASE, job))
+                    if job.get_deadline() <= self.endTime:
+                        heapq.heappush(self.heap, (job.get_deadline(), rank, self.DEADLINE, job))
+                if self.releases is not None:
+                    self.push_next_release()
+                elif item.period >= 0 and event_time + item.period < self.endTime:
+                    heapq.heappush(self.heap, (event_time + item.period, (rank[0], rank[1] + 1), self.PENDING, item))
+        return event_time, events
+
+
+def to_fraction(value) -> Fraction:
+    """the exact decimal value of a JSON number, so that 0.1 is 1/10"""
+    return Fraction(repr(float(value)))
+
+
 class TaskSet(object):
-    def __init__(self, data):
+    """The tasks, schedule window and releases parsed from a task set JSON document.
+
+    With integer_time, every time is converted to an int number of ticks at parse time: tick, or
+    by default the GCD of all periods, WCETs, deadlines, offsets, section lengths and schedule
+    and release times; a Fraction tick is taken exactly. Simulation then runs on exact integer
+    arithmetic; multiplying by self.tick converts back (self.tick is 1 for float times).
+
+    releases, a ReleaseLog, replaces the releaseTimes of data: they are then streamed from the log
+    instead of being held in memory. With integer_time it needs an explicit tick, which every
+    logged time is checked against here rather than during the simulation.
+    """
+
+    def __init__(self, data, build_jobs: bool = True, integer_time: bool = False, tick: float = None,
+                 releases=None):
         self.jobs: list[Job] = []
         self.tasks: dict[int, Task] = {}
         self.events: dict[float, list[tuple[EventType, Job]]] = {}
         self.event_list: list[float] = []
+        self.startTime = float(data[TSJK.KEY_SCHEDULE_START])
+        self.endTime = float(data[TSJK.KEY_SCHEDULE_END])
+        self.releaseTimes: list[tuple[float, int]] | None = None
+        self.releaseLog = releases
+        if releases is not None:
+            self.releaseTimes = releases
+        elif TSJK.KEY_RELEASETIMES in data:
+            self.releaseTimes = [(float(job_release[TSJK.KEY_RELEASETIMES_JOBRELEASE]),
+                                  int(job_release[TSJK.KEY_RELEASETIMES_TASKID]))
+                                 for job_release in data[TSJK.KEY_RELEASETIMES]]
+            self.releaseTimes.sort(key=lambda release: release[0])
         self.parse_data_to_tasks(data)
 
+        self.tick = 1
+        self.tickFraction: Fraction | None = None
+        if integer_time:
+            if tick is None:
+                if self.releaseLog is not None:
+                    raise ValueError("a release log needs an explicit tick with integer_time")
+                tick = self.find_tick()
+            self.set_tick(tick if isinstance(tick, Fraction) else to_fraction(tick))
+        if self.releaseLog is not None:
+            self.releaseLog.configure({task.id: task.period for task in self}, self.startTime, self.tickFraction)
+            if self.tickFraction is not None:
+                self.releaseLog.check_tick()
+
         task_set_resources = {}
         for task_id in self.tasks.keys():
             resources = self.tasks[task_id].get_all_resources()
@@ -50,7 +205,50 @@ class TaskSet(object):
         self.resources = list(task_set_resources.keys())
         self.resources.sort()
 
-        self.build_job_releases(data)
+        if build_jobs:
+            self.build_job_releases(data)
+
+    def find_tick(self) -> Fraction:
+        """the largest tick that all times of the task set are multiples of"""
+        values = [self.startTime, self.endTime]
+        for task in self:
+            values.extend([task.period, task.wcet, task.relativeDeadline, task.offset])
+            values.extend(section[1] for section in task.sectionTable)
+        if self.releaseTimes is not None and self.releaseLog is None:
+            values.extend(release[0] for release in self.releaseTimes)
+
+        tick = Fraction(0)
+        for value in values:
+            if value > 0:
+                value = to_fraction(value)
+                denominator = tick.denominator * value.denominator
+                tick = Fraction(math.gcd(tick.numerator * value.denominator, value.numerator * tick.denominator),
+                                denominator)
+        return tick if tick > 0 else Fraction(1)
+
+    def to_ticks(self, value):
+        """a time as a number of ticks, unchanged for float times"""
+        if self.tickFraction is None:
+            return value
+        ticks = to_fraction(value) / self.tickFraction
+        if ticks.denominator != 1:
+            raise ValueError(f"time {value} is not a multiple of the tick {float(self.tickFraction)}")
+        return int(ticks)
+
+    def set_tick(self, tick: Fraction) -> None:
+        self.tickFraction = tick
+        self.tick = float(tick)
+        self.startTime = self.to_ticks(self.startTime)
+        self.endTime = self.to_ticks(self.endTime)
+        if self.releaseTimes is not None and self.releaseLog is None:
+            self.releaseTimes = [(self.to_ticks(release_time), task_id) for release_time, task_id in self.releaseTimes]
+        for task in self:
+            task.tick = self.tick
+            task.period = self.to_ticks(task.period) if task.period >= 0 else -1
+            task.wcet = self.to_ticks(task.wcet)
+            task.relativeDeadline = self.to_ticks(task.relativeDeadline)
+            task.offset = self.to_ticks(task.offset)
+            task.sectionTable = tuple((resource, self.to_ticks(length)) for resource, length in task.sectionTable)
 
     def parse_data_to_tasks(self, data) -> None:
         task_set = {}
@@ -73,13 +271,17 @@ class TaskSet(object):
     def build_job_releases(self, data) -> None:
         jobs: list[Job] = []
         events: dict[float, list[tuple[EventType, Job]]] = {}
-        schedule_start_time = float(data[TSJK.KEY_SCHEDULE_START])
-        schedule_end_time = float(data[TSJK.KEY_SCHEDULE_END])
-        if TSJK.KEY_RELEASETIMES in data:  # necessary for sporadic releases
-            for job_release in data[TSJK.KEY_RELEASETIMES]:
-                release_time = float(job_release[TSJK.KEY_RELEASETIMES_JOBRELEASE])
-                task_id = int(job_release[TSJK.KEY_RELEASETIMES_TASKID])
-
+        schedule_start_time = self.to_ticks(float(data[TSJK.KEY_SCHEDULE_START]))
+        schedule_end_time = self.to_ticks(float(data[TSJK.KEY_SCHEDULE_END]))
+        releases = None
+        if self.releaseLog is not None:  # validated and converted to ticks while streamed
+            releases = self.releaseLog
+        elif TSJK.KEY_RELEASETIMES in data:  # necessary for sporadic releases
+            releases = ((self.to_ticks(float(job_release[TSJK.KEY_RELEASETIMES_JOBRELEASE])),
+                         int(job_release[TSJK.KEY_RELEASETIMES_TASKID]))
+                        for job_release in data[TSJK.KEY_RELEASETIMES])
+        if releases is not None:
+            for release_time, task_id in releases:
                 if release_time >= schedule_start_time:
                     job = self.get_task_by_id(task_id).spawn_job(release_time)
                     add_job(jobs, events, job, release_time, schedule_end_time)
@@ -104,9 +306,36 @@ class TaskSet(object):
         self.event_list = list(self.events.keys())
         self.event_list.sort()
 
+    def event_source(self) -> EventListSource | EventSource:
+        """the prebuilt events if build_job_releases ran, lazily generated ones otherwise"""
+        if len(self.event_list) > 0:
+            return EventListSource(self.events, self.event_list)
+        return EventSource(self)
+
     def get_all_resources(self) -> list[int]:
         return self.resources
 
+    def get_hyperperiod(self) -> float | None:
+        """LCM of the task periods, None unless every task is periodic"""
+        if self.releaseTimes is not None or len(self.tasks) == 0:
+            return None
+        hyperperiod: Fraction | None = None
+        for task in self:
+            if task.period <= 0:
+                return None
+            period = to_fraction(task.period)
+            if hyperperiod is None:
+                hyperperiod = period
+            else:
+                denominator = hyperperiod.denominator * period.denominator
+                hyperperiod = Fraction(math.lcm(hyperperiod.numerator * period.denominator,
+                                                period.numerator * hyperperiod.denominator), denominator)
+        return float(hyperperiod)
+
+    def get_lowest_priority(self) -> float:
+        """a priority value below every task's, used for free resources"""
+        return max([1000] + [task.get_priority() + 1 for task in self])
+
     def get_highest_priorities(self) -> dict[int, float]:
         priorities: dict[int, float] = {}
         for resource in self.resources:
@@ -154,7 +383,7 @@ class TaskSet(object):
     def print_events(self) -> None:
         print("\nEvents:")
         for event_time in self.event_list:
-            print(f'Events at {event_time}')
+            print(f'Events at {event_time * self.tick}')
             for event in self.events[event_time]:
                 if event[0] == EventType.RELEASE:
                     print("Release of " + str(event[1]))
@@ -0,0 +1,205 @@
+"""
+traceFile.py - binary schedule traces streamed to disk and read back through a memory map
+"""
+
+from __future__ import annotations
+import csv
+import os
+import struct
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+MAGIC = b'SCHTRACE'
+HEADER = struct.Struct('<8sIIdQ')  # magic, version, cores, tick, reserved
+VERSION = 1
+RECORD = struct.Struct('<ddqqqq')  # start, end, task, job, resource, core
+RECORD_FIELDS = [('start', '<f8'), ('end', '<f8'), ('task', '<i8'), ('job', '<i8'), ('resource', '<i8'), ('core', '<i8')]
+COLUMNS = ['Start', 'End', 'Task', 'Job', 'Resource', 'Core']
+
+
+class TraceWriter(object):
+    """A ScheduleTrace that streams its segments to a file instead of keeping them.
+
+    Records are fixed-width (RECORD) after a HEADER, in the order ScheduleTrace would hold
+    them, times in the simulation's time base. Up to buffer_rows records are kept in memory; a
+    segment that continues the last one of its core is merged into it in place, in the buffer
+    or, if already flushed, in the file. Memory stays flat however long the trace grows.
+    """
+
+    def __init__(self, path: str, cores: int = 1, tick: float = 1, buffer_rows: int = 65536):
+        self.path = path
+        self.coreCount = cores
+        self.tick = tick
+        self.bufferRows = buffer_rows
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, cores, tick, 0))
+        self.buffer = bytearray()
+        self.flushedRows = 0
+        self.rowCount = 0
+        self.lastRows: dict[int, tuple[int, float, int, int, int]] = {}  # core -> row, end, task, job, resource
+
+    def add(self, start: float, end: float, task_id: int, job_id: int, resource: int, core: int = 0) -> None:
+        last = self.lastRows.get(core)
+        if last is not None and last[1] == start and last[2:] == (task_id, job_id, resource):
+            self.lastRows[core] = (last[0], end) + last[2:]
+            self.set_end(last[0], end)
+            return
+        self.lastRows[core] = (self.rowCount, end, task_id, job_id, resource)
+        self.buffer += RECORD.pack(start, end, task_id, job_id, resource, core)
+        self.rowCount += 1
+        if self.rowCount - self.flushedRows >= self.bufferRows:
+            self.flush()
+
+    def set_end(self, row: int, end: float) -> None:
+        """overwrite the end of a record, buffered or already written"""
+        packed = struct.pack('<d', end)
+        if row >= self.flushedRows:
+            offset = (row - self.flushedRows) * RECORD.size + 8
+            self.buffer[offset:offset + 8] = packed
+        else:
+            self.file.seek(HEADER.size + row * RECORD.size + 8)
+            self.file.write(packed)
+            self.file.seek(0, os.SEEK_END)
+
+    def flush(self) -> None:
+        self.file.write(self.buffer)
+        self.file.flush()
+        self.flushedRows = self.rowCount
+        self.buffer = bytearray()
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def mark(self) -> tuple:
+        return self.rowCount, dict(self.lastRows)
+
+    def rewind(self, mark: tuple) -> None:
+        """drop the records added since mark, see ScheduleTrace.rewind"""
+        self.flush()
+        self.rowCount, last_rows = mark
+        self.flushedRows = self.rowCount
+        self.file.truncate(HEADER.size + self.rowCount * RECORD.size)
+        self.file.seek(0, os.SEEK_END)
+        self.lastRows = dict(last_rows)
+        for row, end, _, _, _ in self.lastRows.values():
+            self.set_end(row, end)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.rowCount
+
+    def to_dataframe(self):
+        if not self.file.closed:
+            self.flush()
+        return TraceReader(self.path).to_dataframe()
+
+
+class TraceReader(object):
+    """A trace file written by TraceWriter, memory-mapped.
+
+    records is a read-only NumPy structured array backed by the file, and the column
+    properties are views into it, so nothing is copied until the data is converted. NumPy is
+    only imported here, so that writing a trace does not need it.
+    """
+
+    def __init__(self, path: str):
+        import numpy as np
+
+        self.path = path
+        with open(path, 'rb') as trace_file:
+            magic, version, self.coreCount, self.tick, _ = HEADER.unpack(trace_file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} trace file")
+        dtype = np.dtype(RECORD_FIELDS)
+        count = (os.path.getsize(path) - HEADER.size) // dtype.itemsize
+        if count > 0:
+            self.records = np.memmap(path, dtype=dtype, mode='r', offset=HEADER.size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+
+    @property
+    def start(self) -> np.ndarray:
+        return self.records['start']
+
+    @property
+    def end(self) -> np.ndarray:
+        return self.records['end']
+
+    @property
+    def task(self) -> np.ndarray:
+        return self.records['task']
+
+    @property
+    def job(self) -> np.ndarray:
+        return self.records['job']
+
+    @property
+    def resource(self) -> np.ndarray:
+        return self.records['resource']
+
+    @property
+    def core(self) -> np.ndarray:
+        return self.records['core']
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def chunks(self, chunk_rows: int = 65536):
+        """consecutive slices of the records, views into the file"""
+        for i in range(0, len(self.records), chunk_rows):
+            yield self.records[i:i + chunk_rows]
+
+    def columns(self, records: np.ndarray) -> dict:
+        """the columns of some records, times in the task set's units, like ScheduleTrace.to_dataframe"""
+        columns = {
+            'Start': records['start'] * self.tick,
+            'End': records['end'] * self.tick,
+            'Task': records['task'],
+            'Job': records['job'],
+            'Resource': records['resource'].astype(str),
+        }
+        if self.coreCount > 1:
+            columns['Core'] = records['core']
+        return columns
+
+    def to_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame(self.columns(self.records))
+
+    def to_csv(self, path: str, chunk_rows: int = 65536) -> None:
+        """write the trace as CSV one chunk at a time"""
+        with open(path, 'w', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(COLUMNS[:6 if self.coreCount > 1 else 5])
+            for chunk in self.chunks(chunk_rows):
+                writer.writerows(zip(*[column.tolist() for column in self.columns(chunk).values()]))
+
+    def to_parquet(self, path: str, chunk_rows: int = 1 << 20) -> None:
+        """write the trace as Parquet, one row group per chunk, requires pyarrow"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for chunk in self.chunks(chunk_rows):
+                table = pa.table(self.columns(chunk))
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+            if writer is None:
+                pq.write_table(pa.table(self.columns(self.records)), path)
+        finally:
+            if writer is not None:
+                writer.close()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+"""
+traceIndex.py - time-indexed queries over schedule traces and level-of-detail Gantt charts
+"""
+
+from __future__ import annotations
+import argparse
+import html
+
+import numpy as np
+
+from scheduleTrace import ScheduleTrace
+from traceFile import TraceReader, TraceWriter
+
+PALETTE = ['#4c78a8', '#f58518', '#54a24b', '#e45756', '#72b7b2', '#eeca3b', '#b279a2', '#ff9da6', '#9d755d',
+           '#79706e']
+IDLE_COLOR = '#bab0ac'  # resource 0, a section without a resource
+SPIN_COLOR = '#d3d3d3'  # negative resources, a processor spinning on a lock
+
+
+class SegmentGroup(object):
+    """The rows of some segments sorted by start, with the running maximum of their ends.
+
+    Overlap queries are two binary searches: the segments that start before the end of the
+    query, from the first one whose running maximum end passes its start. For segments that do
+    not overlap each other, as those of one core, that range holds exactly the answer.
+    """
+
+    def __init__(self, rows: np.ndarray | None, starts: np.ndarray, ends: np.ndarray):
+        if rows is None and np.all(starts[1:] >= starts[:-1]):
+            # every segment, already in order as traces are: views of the columns, nothing copied
+            self.rows = np.arange(len(starts))
+            self.starts = starts
+            self.ends = ends
+        else:
+            rows = np.arange(len(starts)) if rows is None else rows
+            self.rows = rows[np.argsort(starts[rows], kind='stable')]
+            self.starts = starts[self.rows]
+            self.ends = ends[self.rows]
+        self.maxEnds = np.maximum.accumulate(self.ends) if len(self.rows) > 0 else self.ends
+
+    def overlapping(self, start: float, end: float) -> np.ndarray:
+        """rows of the segments that intersect [start, end), or that contain start if end == start"""
+        high = np.searchsorted(self.starts, end, side='right' if end == start else 'left')
+        low = np.searchsorted(self.maxEnds, start, side='right')
+        if low >= high:
+            return self.rows[:0]
+        candidates = slice(low, high)
+        return self.rows[candidates][self.ends[candidates] > start]
+
+
+class TraceIndex(object):
+    """An interval index over the segments of a trace.
+
+    Segments are grouped by core, task and resource, each group sorted once (on its first
+    query) into a SegmentGroup, so every query costs O(log n) plus the size of its answer.
+    Query times and returned times are in the task set's units; the columns stay in the
+    simulation's time base, as in the trace.
+    """
+
+    def __init__(self, starts, ends, tasks, jobs, resources, cores, tick: float = 1):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.tasks = np.asarray(tasks, dtype=np.int64)
+        self.jobs = np.asarray(jobs, dtype=np.int64)
+        self.resources = np.asarray(resources, dtype=np.int64)
+        self.cores = np.asarray(cores, dtype=np.int64)
+        self.tick = tick
+        self.groups: dict[tuple[str, int | None], SegmentGroup] = {}
+
+    @staticmethod
+    def from_trace(trace: ScheduleTrace | TraceWriter | TraceReader) -> TraceIndex:
+        """the index of an in-memory trace (copied) or of a trace file (memory-mapped)"""
+        if isinstance(trace, TraceWriter):
+            trace.flush()
+            trace = TraceReader(trace.path)
+        if isinstance(trace, TraceReader):
+            return TraceIndex(trace.start, trace.end, trace.task, trace.job, trace.resource, trace.core, trace.tick)
+        return TraceIndex(trace.starts, trace.ends, trace.tasks, trace.jobs, trace.resources, trace.cores,
+                          trace.tick)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def group(self, column: str, value: int = None) -> SegmentGroup:
+        """the segments whose column ('core', 'task' or 'resource') equals value, or all of them"""
+        key = (column, value)
+        if key not in self.groups:
+            rows = None if value is None else np.flatnonzero(getattr(self, column + 's') == value)
+            self.groups[key] = SegmentGroup(rows, self.starts, self.ends)
+        return self.groups[key]
+
+    def segments(self, rows: np.ndarray) -> list[tuple[float, float, int, int, int, int]]:
+        """(start, end, task, job, resource, core) of some rows, times in the task set's units"""
+        return list(zip((self.starts[rows] * self.tick).tolist(), (self.ends[rows] * self.tick).tolist(),
+                        self.tasks[rows].tolist(), self.jobs[rows].tolist(), self.resources[rows].tolist(),
+                        self.cores[rows].tolist()))
+
+    def running_at(self, time: float) -> list[tuple[float, float, int, int, int, int]]:
+        """the segments executing (or spinning) at time, at most one per core"""
+        time /= self.tick
+        return self.segments(np.sort(self.group('segment').overlapping(time, time)))
+
+    def task_segments(self, task_id: int, start: float, end: float) -> list[tuple[float, float, int, int, int, int]]:
+        """the segments of a task that intersect [start, end)"""
+        return self.segments(self.group('task', task_id).overlapping(start / self.tick, end / self.tick))
+
+    def resource_holders(self, resource: int, time: float) -> list[tuple[float, float, int, int, int, int]]:
+        """the segments executing inside a critical section of resource at time"""
+        time /= self.tick
+        return self.segments(self.group('resource', resource).overlapping(time, time))
+
+    def window(self, start: float, end: float) -> np.ndarray:
+        """rows of all segments that intersect [start, end), in the simulation's time base"""
+        return self.group('segment').overlapping(start, end)
+
+    def span(self) -> tuple[float, float]:
+        """first start and last end of the trace, in the task set's units"""
+        if len(self.starts) == 0:
+            return 0.0, 0.0
+        return float(self.starts.min() * self.tick), float(self.ends.max() * self.tick)
+
+
+def coverage(starts: np.ndarray, ends: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """the time covered by disjoint segments, sorted by start, within each bin between edges
+
+    The covered time up to x is the length of the segments that ended before x plus the part
+    of the one containing x; each bin is a difference of that at its edges.
+    """
+    if len(starts) == 0:
+        return np.zeros(len(edges) - 1)
+    lengths = np.concatenate([[0.0], np.cumsum(ends - starts)])
+    count = np.searchsorted(starts, edges, side='left')  # segments starting before each edge
+    last = np.maximum(count - 1, 0)
+    partial = np.where(count > 0, np.clip(edges - starts[last], 0, ends[last] - starts[last]), 0)
+    covered = lengths[last] + partial
+    return np.diff(covered)
+
+
+def resource_color(resource: int, resources: list[int]) -> str:
+    if resource == 0:
+        return IDLE_COLOR
+    if resource < 0:
+        return SPIN_COLOR
+    return PALETTE[resources.index(resource) % len(PALETTE)]
+
+
+def render_gantt(index: TraceIndex, path: str, start: float = None, end: float = None, width: int = 1600,
+                 title: str = 'Schedule') -> int:
+    """write a static HTML Gantt chart of [start, end) (by default the whole trace), returns its rectangle count
+
+    Each task is a lane of width pixels. Per pixel, the segments of the lane in the range are
+    reduced to the time they cover per resource, and the pixel takes the color of the resource
+    covering the most, with an opacity that shows how busy the lane was; runs of equal pixels
+    become one rectangle. The page holds at most lanes * width rectangles however many
+    segments the trace has.
+    """
+    span_start, span_end = index.span()
+    start = span_start if start is None else start
+    end = span_end if end is None else end
+    if end <= start:
+        end = start + 1
+    begin, finish = start / index.tick, end / index.tick
+    rows = index.window(begin, finish)
+    task_ids = sorted(set(np.unique(index.tasks[rows]).tolist()))
+    resources = sorted(resource for resource in np.unique(index.resources[rows]).tolist() if resource > 0)
+    edges = np.linspace(begin, finish, width + 1)
+    pixel = (finish - begin) / width
+
+    lane_height, label_width, axis_height = 24, 80, 30
+    height = axis_height + lane_height * len(task_ids)
+    parts = []
+    rectangles = 0
+    for lane, task_id in enumerate(task_ids):
+        task_rows = index.group('task', task_id).overlapping(begin, finish)
+        task_rows = task_rows[np.argsort(index.starts[task_rows], kind='stable')]
+        lane_resources = np.unique(index.resources[task_rows])
+        covered = np.zeros((len(lane_resources), width))
+        for i, resource in enumerate(lane_resources.tolist()):
+            resource_rows = task_rows[index.resources[task_rows] == resource]
+            covered[i] = coverage(np.clip(index.starts[resource_rows], begin, finish),
+                                  np.clip(index.ends[resource_rows], begin, finish), edges)
+        if len(lane_resources) == 0:
+            continue
+        busy = np.minimum(covered.sum(axis=0) / pixel, 1.0)
+        dominant = lane_resources[np.argmax(covered, axis=0)]
+        opacity = np.ceil(busy * 4) / 4  # quantized up so that neighbouring pixels merge and none vanishes
+        # runs of pixels with the same dominant resource and opacity
+        change = np.flatnonzero((dominant[1:] != dominant[:-1]) | (opacity[1:] != opacity[:-1])) + 1
+        run_starts = np.concatenate([[0], change])
+        run_ends = np.concatenate([change, [width]])
+        y = axis_height + lane * lane_height
+        parts.append(f'<text x="{label_width - 8}" y="{y + lane_height * 0.7}" text-anchor="end">'
+                     f'Task {task_id}</text>')
+        for run_start, run_end in zip(run_starts.tolist(), run_ends.tolist()):
+            if opacity[run_start] == 0:
+                continue
+            resource = int(dominant[run_start])
+            time_start = (begin + run_start * pixel) * index.tick
+            time_end = (begin + run_end * pixel) * index.tick
+            parts.append(f'<rect x="{label_width + run_start}" y="{y + 2}" width="{run_end - run_start}" '
+                         f'height="{lane_height - 4}" fill="{resource_color(resource, resources)}" '
+                         f'fill-opacity="{opacity[run_start]:g}"><title>Task {task_id}, resource {resource}, '
+                         f'{time_start:g} to {time_end:g}, up to {opacity[run_start]:.0%} busy</title></rect>')
+            rectangles += 1
+
+    for tick_mark in np.linspace(start, end, 11).tolist():
+        x = label_width + (tick_mark - start) / (end - start) * width
+        parts.append(f'<line x1="{x:.1f}" y1="{axis_height - 6}" x2="{x:.1f}" y2="{height}" stroke="#eee"/>'
+                     f'<text x="{x:.1f}" y="{axis_height - 10}" text-anchor="middle">{tick_mark:g}</text>')
+    legend = ''.join(f'<span style="background:{resource_color(resource, resources)}">&nbsp;&nbsp;&nbsp;</span> '
+                     f'{label}&nbsp;&nbsp;'
+                     for resource, label in [(0, 'no resource')] + [(r, f'resource {r}') for r in resources] +
+                     [(-1, 'spinning')])
+
+    with open(path, 'w') as output:
+        output.write(f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+                     f'<style>body{{font-family:sans-serif;font-size:12px}}</style></head><body>\n'
+                     f'<h3>{html.escape(title)}: {start:g} to {end:g}, {len(rows)} segments, '
+                     f'{pixel * index.tick:g} per pixel</h3>\n<p>{legend}</p>\n'
+                     f'<svg xmlns="http://www.w3.org/2000/svg" width="{label_width + width + 20}" height="{height}" '
+                     f'font-size="11">\n')
+        output.write('\n'.join(parts))
+        output.write('\n</svg></body></html>\n')
+    return rectangles
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('trace', help='trace file written with a trace_path')
+    parser.add_argument('--at', type=float, default=None, help='print what runs at this time')
+    parser.add_argument('--task', type=int, default=None, help='print the segments of this task in --start/--end')
+    parser.add_argument('--resource', type=int, default=None, help='with --at, print who holds this resource')
+    parser.add_argument('--start', type=float, default=None)
+    parser.add_argument('--end', type=float, default=None)
+    parser.add_argument('--gantt', default=None, help='write a Gantt chart of --start/--end as HTML to this path')
+    parser.add_argument('--width', type=int, default=1600, help='width of the Gantt chart in pixels')
+    args = parser.parse_args()
+
+    index = TraceIndex.from_trace(TraceReader(args.trace))
+    span_start, span_end = index.span()
+    start = span_start if args.start is None else args.start
+    end = span_end if args.end is None else args.end
+    if args.at is not None:
+        found = index.resource_holders(args.resource, args.at) if args.resource is not None else \
+            index.running_at(args.at)
+        for segment in found:
+            print("start={0:g} end={1:g} task={2} job={3} resource={4} core={5}".format(*segment))
+    if args.task is not None:
+        for segment in index.task_segments(args.task, start, end):
+            print("start={0:g} end={1:g} task={2} job={3} resource={4} core={5}".format(*segment))
+    if args.gantt is not None:
+        rectangles = render_gantt(index, args.gantt, start, end, args.width, args.trace)
+        print(f"{rectangles} rectangles written to {args.gantt}")
+
+
+if __name__ == "__main__":
+    main()